@@ -0,0 +1,12 @@
+#! /usr/bin/python
+
+"""
+python -m bin runs the simulation, with the command line of
+cellnet_simulation
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+from cellnet_simulation import cli
+
+cli()
@@ -0,0 +1,143 @@
+#! /usr/bin/python
+
+"""
+this module holds time-varying arrival rates, such as the busy hour
+of a day. the arrivals form a non-homogeneous Poisson process, which
+is drawn by inversion: unit exponential steps of the expected number
+of arrivals are mapped back to times
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import csv
+from bisect import bisect_right
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+class ArrivalProfile(object):
+    def __init__(self, starts, rates, period=DAY):
+        """
+        a piecewise-constant arrival rate, repeating every period
+        :param starts: the time every piece starts at, in seconds into
+                       the period, increasing from 0
+        :param rates: the rates of every piece, in calls per second.
+                      every piece holds a rate per cell, or one rate
+                      for the whole network
+        :type rates: list of lists
+        """
+        if not starts or starts[0] != 0:
+            raise ValueError("the first piece should start at 0")
+        if starts.__len__() != rates.__len__():
+            raise ValueError("expected %d rates, got %d"
+                             % (starts.__len__(), rates.__len__()))
+        if any(start >= end for start, end
+               in zip(starts, list(starts[1:]) + [period])):
+            raise ValueError("the pieces should start in order, "
+                             "within the period")
+        if any(rate < 0 for piece in rates for rate in piece):
+            raise ValueError("rates can't be negative")
+        if set(piece.__len__() for piece in rates).__len__() != 1:
+            raise ValueError("every piece should have as many rates")
+        self.period = period
+        self.starts = list(starts) + [period]
+        self.rates = [float(sum(piece)) for piece in rates]
+        # the expected number of arrivals from the start of the period
+        # to the start of every piece
+        self.expected = [0.0]
+        for i, rate in enumerate(self.rates):
+            self.expected.append(self.expected[-1]
+                                 + rate * (self.starts[i + 1] - self.starts[i]))
+        if self.expected[-1] <= 0:
+            raise ValueError("no calls would ever arrive")
+        # for picking the cell of a call, the cumulative share of
+        # every cell in every piece
+        self.cells = rates[0].__len__()
+        self.shares = [[sum(piece[:cell + 1]) / sum(piece) if sum(piece) else 0
+                        for cell in range(self.cells)] for piece in rates]
+        # the piece and the period of the last arrival, and the expected
+        # number of arrivals up to it. arrivals only move forward, so the
+        # profile is never scanned again
+        self.piece = 0
+        self.cycle = 0
+        self.position = 0.0
+
+    def next_arrival(self, exponential):
+        """
+        :param exponential: a unit exponential variate
+        :return: the time of the next arrival, after the last one
+        """
+        self.position += exponential
+        offset = self.cycle * self.expected[-1]
+        while self.rates[self.piece] == 0 or \
+                self.position > offset + self.expected[self.piece + 1]:
+            self.piece += 1
+            if self.piece == self.rates.__len__():
+                self.piece = 0
+                self.cycle += 1
+                offset = self.cycle * self.expected[-1]
+        return self.cycle * self.period + self.starts[self.piece] + \
+            (self.position - offset - self.expected[self.piece]) \
+            / self.rates[self.piece]
+
+    def rate(self, time):
+        """
+        :return: the arrival rate of the network at time, per second
+        """
+        return self.rates[bisect_right(self.starts, time % self.period) - 1]
+
+    def pick_cell(self, uniform):
+        """
+        :param uniform: a uniform variate in [0, 1)
+        :return: the cell of the last arrival, by the shares of the cells
+        """
+        return min(bisect_right(self.shares[self.piece], uniform),
+                   self.cells - 1)
+
+
+def table(pieces, period=DAY):
+    """
+    :param pieces: pairs of (start hour, calls per hour of the network)
+    """
+    return ArrivalProfile([hour * HOUR for hour, rate in pieces],
+                          [[float(rate) / HOUR] for hour, rate in pieces],
+                          period)
+
+
+def load_csv(path, period=DAY):
+    """
+    read measured rates from a CSV file. every row holds the hour a
+    piece starts at, then the calls per hour of the network, or of
+    every cell in its own column. a header row is skipped
+    """
+    starts, rates = [], []
+    with open(path, "rb") as csv_file:
+        for row in csv.reader(csv_file):
+            if not row or row[0].startswith("#"):
+                continue
+            try:
+                values = [float(value) for value in row]
+            except ValueError:
+                # the header
+                continue
+            starts.append(values[0] * HOUR)
+            rates.append([value / HOUR for value in values[1:]])
+    return ArrivalProfile(starts, rates, period)
+
+
+def build_profile(spec):
+    """
+    :param spec: None for a constant rate (see ARRIVE_MEAN), or
+                 "table:HOUR=RATE;HOUR=RATE;..." or "file:PATH",
+                 with rates in calls per hour
+    """
+    if spec is None:
+        return None
+    kind, _, argument = spec.partition(":")
+    if kind == "table":
+        return table([[float(value) for value in piece.split("=")]
+                      for piece in argument.split(";")])
+    elif kind == "file":
+        return load_csv(argument)
+    raise ValueError("unknown arrival profile " + spec)
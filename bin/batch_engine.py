@@ -0,0 +1,233 @@
+#! /usr/bin/python
+
+"""
+this module runs many replications of the simulation at once. every
+replication is a row of NumPy arrays, and all of them take their next
+event together, in one vectorized step. it supports the network where
+every cell hands off to every cell, at a constant arrival rate
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import numpy
+from numpy.random import RandomState
+from config import Parameters
+
+INF = float("inf")
+# the kinds of calls
+INITIATED = 0
+HANDOFF = 1
+
+
+class BatchSimulation:
+    def __init__(self, replications, parameters=None, seed=None,
+                 queue=8):
+        """
+        :param replications: number of independent replications
+        :param parameters: the model parameters to override (see config)
+        :param seed: seed for the random numbers, to reproduce the batch
+        :param queue: room for pending calls in every cell to start
+                      with, it's doubled whenever a queue is full
+        """
+        self.params = Parameters(**(parameters or {}))
+        kind, _, cells = self.params.TOPOLOGY.partition(":")
+        if kind != "full":
+            raise ValueError("the batch engine only runs full topologies")
+        if self.params.ARRIVAL_PROFILE is not None:
+            raise ValueError("the batch engine only runs constant arrival "
+                             "rates")
+        self.replications = replications
+        self.cells = int(cells)
+        self.channels = self.params.CHANNELS
+        self.end_time = self.params.END_TIME
+        self.random = RandomState(seed)
+        self.rows = numpy.arange(replications)
+
+        shape = (replications, self.cells, self.channels)
+        # when the call on every channel hangs up, INF if it's free
+        self.busy_until = numpy.full(shape, INF)
+        self.talking = numpy.zeros(shape, numpy.int8)
+        # the pending calls of every cell: when they give up (INF for
+        # an empty place), when they started waiting, and their kind
+        shape = (replications, self.cells, queue)
+        self.giveup = numpy.full(shape, INF)
+        self.waiting = numpy.full(shape, INF)
+        self.waiting_kind = numpy.zeros(shape, numpy.int8)
+        self.giveup_time = numpy.array([self.params.INITIAL_GIVEUP_TIME,
+                                        self.params.HANDOFF_GIVEUP_TIME],
+                                       float)
+        # the first call arrives at 0, like in CellnetSimulation
+        self.next_arrival = numpy.zeros(replications)
+        self.interarrival = float(self.params.ARRIVE_SCALE) \
+            / self.params.ARRIVE_MEAN
+
+        # for every kind: the calls that were over or moved on,
+        # those that failed, and the time they waited
+        self.total = numpy.zeros((replications, 2))
+        self.failed = numpy.zeros((replications, 2))
+        self.pending = numpy.zeros((replications, 2))
+        self.busy = numpy.zeros(replications)
+
+    def run(self):
+        """
+        run every replication to END_TIME
+        :return: the number of steps it took
+        """
+        steps = 0
+        queue = self.giveup.shape[2]
+        while True:
+            busy_until = self.busy_until.reshape(self.replications, -1)
+            hangup = busy_until.argmin(1)
+            hangup_time = busy_until[self.rows, hangup]
+            giveup = self.giveup.reshape(self.replications, -1)
+            reneg = giveup.argmin(1)
+            reneg_time = giveup[self.rows, reneg]
+            now = numpy.minimum(self.next_arrival,
+                                numpy.minimum(hangup_time, reneg_time))
+            active = now <= self.end_time
+            if not active.any():
+                return steps
+            steps += 1
+
+            arrivals = active & (self.next_arrival <= hangup_time) & \
+                (self.next_arrival <= reneg_time)
+            hangups = active & ~arrivals & (hangup_time <= reneg_time)
+            renegs = active & ~arrivals & ~hangups
+
+            rows = renegs.nonzero()[0]
+            if rows.size:
+                cells, places = numpy.divmod(reneg[rows], queue)
+                self._reneg(rows, cells, places, now[rows])
+            rows = hangups.nonzero()[0]
+            if rows.size:
+                cells, channels = numpy.divmod(hangup[rows], self.channels)
+                self._hangup(rows, cells, channels, now[rows])
+            rows = arrivals.nonzero()[0]
+            if rows.size:
+                self.next_arrival[rows] += self.random.exponential(
+                    self.interarrival, rows.size)
+                self._request(rows, self.random.randint(0, self.cells,
+                                                        rows.size),
+                              numpy.zeros(rows.size, numpy.int8), now[rows])
+            queue = self.giveup.shape[2]
+
+    def _reneg(self, rows, cells, places, now):
+        kinds = self.waiting_kind[rows, cells, places]
+        self.failed[rows, kinds] += 1
+        self.total[rows, kinds] += 1
+        self.pending[rows, kinds] += now - self.waiting[rows, cells, places]
+        self.giveup[rows, cells, places] = INF
+        self.waiting[rows, cells, places] = INF
+
+    def _hangup(self, rows, cells, channels, now):
+        self.total[rows, self.talking[rows, cells, channels]] += 1
+        # the channel goes to the first pending call of the cell
+        waiting = self.waiting[rows, cells]
+        if self.params.HANDOFF_PRIORITY:
+            # handoffs come first, as if they had waited since before
+            # the start. the offset is small enough that they still
+            # keep their own order
+            waiting = numpy.where(self.waiting_kind[rows, cells] == HANDOFF,
+                                  waiting - (self.end_time + 1), waiting)
+        first = waiting.argmin(1)
+        queued = numpy.isfinite(waiting[numpy.arange(rows.size), first])
+        self.busy_until[rows[~queued], cells[~queued], channels[~queued]] = INF
+        if queued.any():
+            rows_q, cells_q, first = rows[queued], cells[queued], first[queued]
+            kinds = self.waiting_kind[rows_q, cells_q, first]
+            self.pending[rows_q, kinds] += \
+                now[queued] - self.waiting[rows_q, cells_q, first]
+            self.giveup[rows_q, cells_q, first] = INF
+            self.waiting[rows_q, cells_q, first] = INF
+            self._talk(rows_q, cells_q, channels[queued], kinds, now[queued])
+        # and the call that hung up may go on in another cell
+        handoffs = self.random.random_sample(rows.size) <= \
+            self.params.HANDOFF_RATIO
+        if handoffs.any():
+            self._request(rows[handoffs],
+                          self.random.randint(0, self.cells, handoffs.sum()),
+                          numpy.ones(handoffs.sum(), numpy.int8),
+                          now[handoffs])
+
+    def _request(self, rows, cells, kinds, now):
+        free = numpy.isinf(self.busy_until[rows, cells])
+        found = free.any(1)
+        if found.any():
+            self._talk(rows[found], cells[found], free[found].argmax(1),
+                       kinds[found], now[found])
+        if found.all():
+            return
+        rows, cells, kinds, now = rows[~found], cells[~found], \
+            kinds[~found], now[~found]
+        empty = numpy.isinf(self.giveup[rows, cells])
+        if self.params.PENDING_CAPACITY is not None:
+            # a call that finds the queue full fails at once
+            full = (~empty).sum(1) >= self.params.PENDING_CAPACITY
+            self.failed[rows[full], kinds[full]] += 1
+            self.total[rows[full], kinds[full]] += 1
+            rows, cells, kinds, now, empty = rows[~full], cells[~full], \
+                kinds[~full], now[~full], empty[~full]
+            if not rows.size:
+                return
+        if not empty.any(1).all():
+            self._grow()
+            empty = numpy.isinf(self.giveup[rows, cells])
+        places = empty.argmax(1)
+        self.giveup[rows, cells, places] = now + self.giveup_time[kinds]
+        self.waiting[rows, cells, places] = now
+        self.waiting_kind[rows, cells, places] = kinds
+
+    def _talk(self, rows, cells, channels, kinds, now):
+        talk = self.random.normal(self.params.TALK_MEAN, self.params.TALK_VAR,
+                                  rows.size).clip(5)
+        self.busy_until[rows, cells, channels] = now + talk
+        self.talking[rows, cells, channels] = kinds
+        # the channel is busy up to the end, at most
+        self.busy[rows] += numpy.minimum(talk, self.end_time - now)
+
+    def _grow(self):
+        def grown(array, value):
+            return numpy.concatenate(
+                [array, numpy.full(array.shape, value, array.dtype)], 2)
+        self.giveup = grown(self.giveup, INF)
+        self.waiting = grown(self.waiting, INF)
+        self.waiting_kind = grown(self.waiting_kind, 0)
+
+    def prod_metrics(self):
+        """
+        :return: the overall statistics of every replication,
+                 as listed in PROD_METRICS
+        """
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            fail_rate = self.failed / self.total
+            avg_pending = self.pending / self.total
+        utilization = self.busy / (self.cells * self.channels * self.end_time)
+        return [tuple(metrics) for metrics in numpy.column_stack([
+            fail_rate[:, HANDOFF], fail_rate[:, INITIATED], utilization,
+            avg_pending[:, HANDOFF], avg_pending[:, INITIATED]]).tolist()]
+
+# Unit tests
+if __name__ == "__main__":
+    from cellnet_statistics import PROD_METRICS
+    from runner import run_replications, summarize
+
+    # on a loaded network, where handoffs wait before the new calls, the
+    # means of the two engines must be within both confidence intervals
+    parameters = {"HANDOFF_PRIORITY": True, "INITIAL_GIVEUP_TIME": 600,
+                  "HANDOFF_GIVEUP_TIME": 600, "ARRIVE_SCALE": 28,
+                  "END_TIME": 60*60*24}
+    batch = summarize(run_replications(300, 1, parameters=parameters,
+                                       engine="batch", batch=100))
+    objects = summarize(run_replications(30, 1, parameters=parameters))
+    for metric, (batch_mean, batch_half_width), (mean, half_width) \
+            in zip(PROD_METRICS, batch, objects):
+        print metric, abs(batch_mean - mean) <= batch_half_width + half_width
+
+    """
+    expected output:
+    handoff_fail_rate True
+    initiated_fail_rate True
+    channel_utilization True
+    handoff_avg_pending True
+    initiated_avg_pending True
+    """
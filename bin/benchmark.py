@@ -0,0 +1,314 @@
+#! /usr/bin/python
+
+"""
+benchmarks for the simulation's core paths.
+every benchmark reports how many operations per second it achieved,
+and the suite compares them against a stored baseline
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+from multiprocessing import Pool
+from random import Random
+from timeit import default_timer
+import numpy
+from cellnet_entities import Call
+from cellnet_simulation import CellnetSimulation
+from event_log import CALL
+import event_log
+from event_queue import EventQueue, Event
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "..", "benchmark_baseline.json")
+
+DEPTHS = [10**3, 10**4, 10**5, 10**6]
+CHANNEL_COUNTS = [10, 100, 1000]
+# mean seconds between calls: ~5 erlangs on the 70 channels of the
+# default network, and ~80, more than the channels can carry
+LOADS = {"light": 240, "saturated": 15}
+RECORDS = [10**5, 10**6, 10**7]
+IMPORTS = ["cellnet_simulation", "runner", "sweep"]
+
+
+def bench_event_queue(depth, operations=10**5, seed=0):
+    """
+    the classic "hold" benchmark: fill the queue to the given depth,
+    then repeatedly pop the next event and schedule a new one, so the
+    depth stays constant while we measure
+    :return: events per second
+    """
+    rand = Random(seed)
+    event_q = EventQueue(end_time=float("inf"))
+    event = Event(None, None)
+    for _ in xrange(depth):
+        event_q.push(rand.expovariate(1.0) * depth, event)
+    start = default_timer()
+    for _ in xrange(operations):
+        event_q.pop()
+        event_q.push(rand.expovariate(1.0) * depth, event)
+    return operations / (default_timer() - start)
+
+
+def bench_cancel(depth, operations=10**5, seed=0):
+    """
+    hold, with a cancellation: every operation schedules two events,
+    cancels one of them and pops the next
+    :return: operations per second
+    """
+    rand = Random(seed)
+    event_q = EventQueue(end_time=float("inf"))
+    event = Event(None, None)
+    for _ in xrange(depth):
+        event_q.push(rand.expovariate(1.0) * depth, event)
+    start = default_timer()
+    for _ in xrange(operations):
+        event_q.push(rand.expovariate(1.0) * depth, event).cancel()
+        event_q.push(rand.expovariate(1.0) * depth, event)
+        event_q.pop()
+    return operations / (default_timer() - start)
+
+
+def bench_free_channel(channels, operations=10**5, seed=0):
+    """
+    allocate a channel of a base station and free it again, with half
+    of its channels busy
+    :return: allocations per second
+    """
+    simulation = CellnetSimulation({"CHANNELS": channels}, seed=seed)
+    base_station = simulation.network.cells[0].base_station
+    for _ in xrange(channels / 2):
+        base_station.free_channel()
+    start = default_timer()
+    for _ in xrange(operations):
+        base_station.free_channel().evaq()
+    return operations / (default_timer() - start)
+
+
+def bench_simulation(load, end_time=60*60*48, seed=0):
+    """
+    run a full simulation, see LOADS
+    :return: events per second
+    """
+    simulation = CellnetSimulation(
+        {"END_TIME": end_time, "ARRIVE_SCALE": LOADS[load]}, seed=seed)
+    start = default_timer()
+    simulation.run()
+    elapsed = default_timer() - start
+    # every event that was pushed was either dispatched or cancelled
+    return simulation.event_q.sequence / elapsed
+
+
+def synthetic_log(records, seed=0):
+    """
+    a log of the given length, made of copies of the log of one
+    simulation, one after the other
+    :return: the columns of the log, and its end time
+    """
+    simulation = CellnetSimulation(keep_log=True, seed=seed)
+    simulation.run()
+    log = simulation._log
+    span = simulation.event_q.get_time()
+    columns = dict((name, log.column(name)) for name in log.columns)
+    copies = records / log.__len__() + 1
+    offsets = numpy.repeat(numpy.arange(copies), log.__len__())[:records]
+    tiled = dict((name, numpy.tile(column, copies)[:records])
+                 for name, column in columns.iteritems())
+    tiled["time"] += offsets * span
+    # calls of different copies are different calls
+    calls = tiled["kind"] == CALL
+    tiled["id"][calls] += offsets[calls] * simulation.calls
+    return tiled, copies * span
+
+
+def bench_statistics(records, seed=0):
+    """
+    compute the channel and call statistics out of a full log
+    :return: records per second
+    """
+    columns, end_time = synthetic_log(records, seed)
+    start = default_timer()
+    event_log.channel_statistics(columns["time"], columns["kind"],
+                                 columns["id"], columns["state"], end_time)
+    event_log.call_statistics(columns["time"], columns["kind"],
+                              columns["id"], columns["event"],
+                              columns["state"])
+    return records / (default_timer() - start)
+
+
+def bench_import(module, repeat=5):
+    """
+    import a module in a fresh interpreter, as a new worker would
+    :return: imports per second
+    """
+    script = "from timeit import default_timer; start = default_timer(); " \
+        "import %s; print default_timer() - start" % module
+    best = min(float(subprocess.check_output([sys.executable, "-c", script],
+                                             cwd=HERE))
+               for _ in xrange(repeat))
+    return 1 / best
+
+
+def bench_startup(repeat=5):
+    """
+    run "python -m bin" for a simulated hour, which is mostly the
+    cost of starting a run
+    :return: starts per second
+    """
+    best = None
+    for _ in xrange(repeat):
+        start = default_timer()
+        subprocess.check_output([sys.executable, "-m", "bin", "-s", "0",
+                                 "--end-time", "3600"],
+                                cwd=os.path.join(HERE, os.pardir))
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return 1 / best
+
+
+def bench_spawn(tasks=4):
+    """
+    start a pool of one worker, and run a few short replications on it
+    :return: pools per second
+    """
+    start = default_timer()
+    pool = Pool(1)
+    try:
+        pool.map(_short_run, range(tasks))
+    finally:
+        pool.close()
+        pool.join()
+    return 1 / (default_timer() - start)
+
+
+def _short_run(seed):
+    simulation = CellnetSimulation({"END_TIME": 60}, seed=seed)
+    simulation.run()
+    return simulation.calls
+
+
+def bench_memory(end_time=60*60*48, seed=0):
+    """
+    run a simulation in a fresh process, so its peak memory is its own
+    :return: the number of simulated calls, the peak RSS in KB, and the
+             Call and Event objects allocated per simulated call
+    """
+    pool = Pool(1)
+    try:
+        return pool.apply(_memory, (end_time, seed))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _memory(end_time, seed):
+    simulation = CellnetSimulation({"END_TIME": end_time}, seed=seed)
+    simulation.run()
+    calls = simulation.calls
+    # calls and events are pooled and never freed,
+    # so every one that was ever allocated is still around
+    objects = gc.get_objects()
+    allocated_calls = sum(1 for obj in objects if type(obj) is Call)
+    allocated_events = sum(1 for obj in objects if type(obj) is Event)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return calls, peak_rss, float(allocated_calls) / calls, \
+        float(allocated_events) / calls
+
+
+def run_suite(quick=False, repeat=3):
+    """
+    run every benchmark, keeping the best of repeat runs
+    :param quick: skip the largest sizes
+    :return: benchmark name -> operations per second
+    """
+    benchmarks = []
+    for depth in DEPTHS[:-1] if quick else DEPTHS:
+        benchmarks.append(("event_queue_hold_" + str(depth),
+                           bench_event_queue, (depth,)))
+        benchmarks.append(("event_queue_cancel_" + str(depth),
+                           bench_cancel, (depth,)))
+    for channels in CHANNEL_COUNTS:
+        benchmarks.append(("free_channel_" + str(channels),
+                           bench_free_channel, (channels,)))
+    for load in sorted(LOADS):
+        benchmarks.append(("simulation_" + load, bench_simulation, (load,)))
+    for records in RECORDS[:-1] if quick else RECORDS:
+        benchmarks.append(("statistics_" + str(records),
+                           bench_statistics, (records,)))
+
+    for module in IMPORTS:
+        benchmarks.append(("import_" + module, bench_import, (module,)))
+    benchmarks.append(("startup", bench_startup, ()))
+    benchmarks.append(("spawn", bench_spawn, ()))
+
+    results = {}
+    for name, benchmark, args in benchmarks:
+        results[name] = max(benchmark(*args) for _ in xrange(repeat))
+    return results
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    :param tolerance: the fraction of the baseline a benchmark may lose
+    :return: the names of the benchmarks that got slower than that
+    """
+    return sorted(name for name, result in results.iteritems()
+                  if name in baseline
+                  and result < baseline[name] * (1 - tolerance))
+
+
+def load_baseline(path=BASELINE):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(results, path=BASELINE):
+    with open(path, "w") as baseline_file:
+        json.dump(results, baseline_file, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="benchmark the simulation, against a baseline")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="the fraction of the baseline a benchmark "
+                             "may lose before it's a regression")
+    parser.add_argument("--quick", action="store_true",
+                        help="skip the largest sizes")
+    parser.add_argument("--memory", action="store_true",
+                        help="also report the memory of a run")
+    args = parser.parse_args()
+
+    results = run_suite(args.quick)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, args.tolerance)
+
+    print "benchmark,ops_per_sec,baseline,ratio"
+    for name in sorted(results):
+        if name in baseline:
+            print "%s,%d,%d,%.2f" % (name, results[name], baseline[name],
+                                     results[name] / baseline[name]) \
+                + (",REGRESSION" if name in regressions else "")
+        else:
+            print "%s,%d,," % (name, results[name])
+    if args.memory:
+        print
+        print "calls,peak_rss_kb,calls_allocated_per_call," \
+            "events_allocated_per_call"
+        print ",".join(str(value) for value in bench_memory())
+
+    if args.save:
+        save_baseline(results, args.baseline)
+    elif regressions:
+        sys.exit(1)
@@ -6,45 +6,74 @@ author: Geiger&Geiger
 created: 29/08/16
 """
 
-from random import choice, gauss, uniform, expovariate
-from uuid import uuid4
-from event_queue import Event
-from config import *
+from collections import OrderedDict
+from arrival_profile import build_profile
+from cellnet_statistics import STATES
+from topology import build_topology
 
 
 class Network:
     def __init__(self, simulation):
         self.simulation = simulation
-        # as stated in the doc, the simulation network contains 7 cells
-        self.cells = [Cell(simulation=self.simulation, id=x) for x in range(7)]
+        # as stated in the doc, the simulation network contains 7 cells,
+        # unless the topology says otherwise
+        topology = build_topology(self.simulation.params.TOPOLOGY)
+        self.cells = [Cell(simulation=self.simulation, id=x)
+                      for x in range(topology.cells)]
+        # the cells every cell hands its calls off to
+        self.neighbours = None
+        if topology.neighbours is not None:
+            self.neighbours = [[self.cells[neighbour] for neighbour in adjacent]
+                               for adjacent in topology.neighbours]
+        # an arrival profile with a rate per cell picks the cells of
+        # the new calls
+        self.profile = self.simulation.generator.profile
+        if self.profile is not None and self.profile.cells == 1:
+            self.profile = None
+        if self.profile is not None and \
+                self.profile.cells != self.cells.__len__():
+            raise ValueError("the arrival profile has rates for %d cells, "
+                             "the network has %d"
+                             % (self.profile.cells, self.cells.__len__()))
 
     def pick_cell(self, call):
-        return choice(self.cells)
+        if call.state == Call.HANDOFF:
+            if self.neighbours is not None:
+                return self.simulation.random.choice(
+                    self.neighbours[call.cell.id])
+        elif self.profile is not None:
+            return self.cells[self.profile.pick_cell(
+                self.simulation.random.random())]
+        return self.simulation.random.choice(self.cells)
 
 
-class Cell:
+class Cell(object):
+    __slots__ = ("id", "simulation", "base_station", "pending_calls")
+
     def __init__(self, simulation, id=0):
         self.id = id
         self.simulation = simulation
         # each cell contains one base station
         self.base_station = BaseStation(cell=self, simulation=self.simulation)
-        self.pending_calls = []
-        self.cancel_schedule = {}
+        self.pending_calls = PendingQueue(
+            simulation.params.PENDING_CAPACITY,
+            simulation.params.HANDOFF_PRIORITY)
 
     def pick_channel(self, call):
         channel = self.base_station.free_channel()
         if channel:
             return channel
         else:
-            if call.state in ["incoming", "outgoing"]:
-                hangup_time = INITIAL_GIVEUP_TIME
+            if call.state != Call.HANDOFF:
+                hangup_time = self.simulation.params.INITIAL_GIVEUP_TIME
             else:
-                hangup_time = HANDOFF_GIVEUP_TIME
-            self.pending_calls.append(call)
-            hangup_event = Event(call, call.reneg)
-            self.simulation.event_q.push(hangup_time, hangup_event)
-            hangup_time += self.simulation.event_q.get_time()
-            self.cancel_schedule[call] = (hangup_time, hangup_event)
+                hangup_time = self.simulation.params.HANDOFF_GIVEUP_TIME
+            if not self.pending_calls.push(call):
+                # no room to wait, the call gives up right away
+                hangup_time = 0
+            event_q = self.simulation.event_q
+            call.hangup = event_q.push(hangup_time,
+                                       event_q.new_event(call, call.reneg))
 
     def reneg(self, call):
         return self.pending_calls.remove(call)
@@ -60,42 +89,120 @@ class Cell:
         are called
         """
         if self.pending_calls.__len__() > 0:
-            call = self.pending_calls.pop(0)
-            hangup_time, hangup_event = self.cancel_schedule[call]
-            self.simulation.event_q.cancel_event(hangup_time, hangup_event)
+            call = self.pending_calls.pop()
+            if call.hangup:
+                call.hangup.cancel()
+                call.hangup = None
             return call.receive_channel(self.pick_channel(call=call))
         return True
 
 
-class BaseStation:
+class PendingQueue(object):
+    __slots__ = ("capacity", "handoffs", "calls")
+
+    def __init__(self, capacity=None, priority=False):
+        """
+        the calls waiting for a channel in a cell, first come first
+        served. pushing, popping and removing a call are all O(1)
+        :param capacity: most calls to hold, None for no limit
+        :param priority: serve the handoffs before any new call
+        """
+        self.capacity = capacity
+        # call id -> call, in the order they came
+        self.calls = OrderedDict()
+        self.handoffs = self.calls
+        if priority:
+            self.handoffs = OrderedDict()
+
+    def __len__(self):
+        if self.handoffs is self.calls:
+            return self.calls.__len__()
+        return self.calls.__len__() + self.handoffs.__len__()
+
+    def push(self, call):
+        """
+        :return: whether there was room for the call
+        """
+        if self.capacity is not None and self.__len__() >= self.capacity:
+            return False
+        if call.state == Call.HANDOFF:
+            self.handoffs[call.id] = call
+        else:
+            self.calls[call.id] = call
+        return True
+
+    def pop(self):
+        """
+        :return: the call to serve next
+        """
+        if self.handoffs:
+            return self.handoffs.popitem(last=False)[1]
+        return self.calls.popitem(last=False)[1]
+
+    def remove(self, call):
+        """
+        :return: whether the call was waiting
+        """
+        if self.handoffs.pop(call.id, None) is not None:
+            return True
+        return self.calls.pop(call.id, None) is not None
+
+
+class BaseStation(object):
+    __slots__ = ("cell", "simulation", "channels", "free_channels")
+
     def __init__(self, cell, simulation=None):
         self.cell = cell
         if simulation is None:
             self.simulation = self.cell.simulation
         else:
             self.simulation = simulation
-        # initialize 10 channels to the base station
+        # initialize the channels of the base station,
+        # their ids are numbered cell by cell
+        count = self.simulation.params.CHANNELS
         self.channels = [
             Channel(base_station=self, simulation=self.simulation,
-                    id=(x*10)+self.cell.id) for x in range(10)
+                    id=self.cell.id*count+x) for x in range(count)
             ]
-
-    def free_channel(self):
-        free_channels = []
+        # the pool of free channels. every free channel knows its
+        # position in the pool, so it's taken out by swapping it
+        # with the last one, and picking a channel is O(1)
+        self.free_channels = []
         for channel in self.channels:
             if channel.free:
-                free_channels.append(channel)
-        if free_channels.__len__() > 0:
-            channel = choice(free_channels)
+                self.release(channel)
+
+    def free_channel(self):
+        if self.free_channels.__len__() > 0:
+            channel = self.simulation.random.choice(self.free_channels)
+            self.take(channel)
             channel.allocate()
             return channel
         return False
 
-    def channel_evaq(self):
+    def take(self, channel):
+        last = self.free_channels.pop()
+        if last is not channel:
+            self.free_channels[channel.position] = last
+            last.position = channel.position
+        channel.position = None
+
+    def release(self, channel):
+        channel.position = self.free_channels.__len__()
+        self.free_channels.append(channel)
+
+    def channel_evaq(self, channel):
+        self.release(channel)
         self.cell.channel_evaq()
 
 
-class Channel:
+class Channel(object):
+    __slots__ = ("id", "base_station", "simulation", "free", "position")
+
+    # states
+    FREE = STATES.index("free")
+    BUSY = STATES.index("busy")
+
     def __init__(self, base_station, simulation=None, free=True, id=0):
         self.id = id
         self.base_station = base_station
@@ -104,6 +211,8 @@ class Channel:
         else:
             self.simulation = simulation
         self.free = free
+        # position among the free channels of the base station
+        self.position = None
 
     def allocate(self):
         self.free = False
@@ -112,25 +221,50 @@ class Channel:
     def evaq(self):
         self.free = True
         self.simulation.log(self, self.simulation.FREE)
-        self.base_station.channel_evaq()
+        self.base_station.channel_evaq(self)
 
     @property
     def state(self):
         if self.free:
-            return "free"
+            return Channel.FREE
         else:
-            return "busy"
+            return Channel.BUSY
+
 
+class Call(object):
+    __slots__ = ("id", "state", "cell", "channel", "hangup", "simulation")
+
+    # states
+    INCOMING = STATES.index("incoming")
+    OUTGOING = STATES.index("outgoing")
+    HANDOFF = STATES.index("handoff")
 
-class Call:
     def __init__(self, simulation):
-        self.id = uuid4()  # it'll be useful when we'll analyze the log
-        self.state = choice(["incoming", "outgoing"])
+        self.simulation = simulation
+        self.start()
+
+    def start(self):
+        """
+        start a new call. calls that are over are recycled by the
+        simulation, so this may be a call object that was used before
+        """
+        self.id = self.simulation.new_call_id()  # it'll be useful when we'll analyze the log
+        if self.simulation.variates.incoming.next():
+            self.state = Call.INCOMING
+        else:
+            self.state = Call.OUTGOING
         self.cell = None
         self.channel = None
-        self.simulation = simulation
+        # handle of the scheduled give-up, while the call is pending
+        self.hangup = None
         self.request_channel()
 
+    def finish(self):
+        self.cell = None
+        self.channel = None
+        self.hangup = None
+        self.simulation.call_pool.append(self)
+
     def request_channel(self):
         self.cell = self.simulation.network.pick_cell(self)
         channel = self.cell.pick_channel(self)
@@ -142,37 +276,51 @@ class Call:
     def receive_channel(self, channel):
         self.channel = channel
         self.simulation.log(self, self.simulation.TALK)
-        transition_time = max(gauss(TALK_MEAN, TALK_VAR), 5)
-        self.simulation.event_q.push(transition_time,
-                                     Event(self, self.transition))
+        transition_time = self.simulation.variates.talk.next()
+        event_q = self.simulation.event_q
+        event_q.push(transition_time, event_q.new_event(self, self.transition))
 
     def transition(self):
         self.channel.evaq()
-        if uniform(0, 1) <= HANDOFF_RATIO:
+        if self.simulation.variates.handoff.next():
             self.simulation.log(self, self.simulation.HANDOFF)
-            self.state = "handoff"
+            self.state = Call.HANDOFF
             self.request_channel()
         else:
             self.simulation.log(self, self.simulation.SUCCESS)
+            self.finish()
 
     def reneg(self):
         self.simulation.log(self, self.simulation.FAILED)
         self.cell.reneg(self)
+        self.finish()
 
 
 class CallGenerator:
+    # the class of the calls it generates
+    call_class = Call
+
     def __init__(self, simulation):
         """
         initialize calling generation by setting the first call at time 0
         """
         self.simulation = simulation
-        self.simulation.event_q.push(0,
-                                     Event(self, self.generate))
+        # the time-varying arrival rate, if there's one
+        self.profile = build_profile(simulation.params.ARRIVAL_PROFILE)
+        event_q = self.simulation.event_q
+        event_q.push(0, event_q.new_event(self, self.generate))
 
     def generate(self):
-        Call(self.simulation)
-        self.simulation.event_q.push(expovariate(ARRIVE_MEAN)*ARRIVE_SCALE,  # mean: a call every 3 minutes
-                                     Event(self, self.generate))
+        if self.simulation.call_pool:
+            self.simulation.call_pool.pop().start()
+        else:
+            self.call_class(self.simulation)
+        event_q = self.simulation.event_q
+        interarrival = self.simulation.variates.interarrival.next()  # mean: a call every 3 minutes
+        if self.profile is not None:
+            interarrival = self.profile.next_arrival(interarrival) \
+                - event_q.get_time()
+        event_q.push(interarrival, event_q.new_event(self, self.generate))
 
 
 class NoFreeChannelError(Exception):
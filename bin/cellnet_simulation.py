@@ -7,9 +7,17 @@ author: Geiger&Geiger
 created: 29/08/16
 """
 
-from numpy import mean, var
+import cPickle
+import copy_reg
+import types
+from random import Random
 from event_queue import EventQueue
 from cellnet_entities import Network, CallGenerator
+from cellnet_statistics import OnlineStatistics, TimeOfDayStatistics, \
+    report, prod_metrics, PROD_METRICS
+from convergence import ConvergenceMonitor
+from variates import Variates
+import cellnet_statistics
 from config import *
 
 
@@ -17,279 +25,308 @@ class CellnetSimulation:
 
     # the "enum" part of the simulation, for the log
     # Call enum
-    TALK = 1
-    SUCCESS = 2
-    FAILED = 3
-    HANDOFF = 4
-    PENDING = 5
+    TALK = cellnet_statistics.TALK
+    SUCCESS = cellnet_statistics.SUCCESS
+    FAILED = cellnet_statistics.FAILED
+    HANDOFF = cellnet_statistics.HANDOFF
+    PENDING = cellnet_statistics.PENDING
     # Channel enum
-    FREE = 11
-    BUSY = 12
+    FREE = cellnet_statistics.FREE
+    BUSY = cellnet_statistics.BUSY
 
-    def __init__(self):
-        # TODO: read end time from configuration file
+    def __init__(self, parameters=None, keep_log=KEEP_LOG,
+                 trace_path=TRACE_PATH, seed=None,
+                 series_interval=SERIES_INTERVAL):
+        """
+        :param parameters: the model parameters to override (see config)
+        :type parameters: dict
+        :param keep_log: keep the full log of events, and not only the
+                         online statistics. the log grows with the run
+        :param trace_path: if given, write the log to this trace file
+                           as the simulation runs (see event_trace)
+        :param seed: seed for the random numbers, to reproduce a run
+        :param series_interval: if given, keep time series of every cell
+                                over intervals of this many seconds
+                                (see time_series)
+        """
+        # every random number of the simulation comes from its own
+        # generators, so its state can be checkpointed
+        self.random = Random(seed)
+        self.params = Parameters(**(parameters or {}))
+        self.variates = Variates(self.params, seed)
         # we want to run the simulation for a day,
         # and we count in seconds
-        self.event_q = EventQueue()
+        self.event_q = EventQueue(self.params.END_TIME)
+        # calls are numbered in order, and recycled once they're over
+        self.calls = 0
+        self.call_pool = []
         self.generator = CallGenerator(self)
         self.network = Network(self)
-        self._log = []  # matrix of the form (TIME, ENTITY, EVENT)
+        cells = self.network.cells.__len__()
+        self.stats = OnlineStatistics(cells, self.params.CHANNELS)
+        self.recorders = [self.stats]
+        self.keep_log = keep_log
+        self._log = None
+        # the recorders are imported only when they're used, they load
+        # numpy, which most runs can do without
+        if keep_log:
+            from event_log import EventLog
+            # columns of the form (TIME, KIND, ID, EVENT, STATE)
+            self._log = EventLog(cells, self.params.CHANNELS)
+            self.recorders.append(self._log)
+        self.trace = None
+        if trace_path is not None:
+            from event_trace import TraceWriter
+            self.trace = TraceWriter(trace_path, cells, self.params.CHANNELS)
+            self.recorders.append(self.trace)
+        self.series = None
+        if series_interval is not None:
+            from time_series import CellTimeSeries
+            self.series = CellTimeSeries(cells, self.params.CHANNELS,
+                                         series_interval)
+            self.recorders.append(self.series)
+        # set by profile, dispatches the events if it's there
+        self.profiler = None
+        # observers that sample the statistics over time. each has
+        # next_sample, the time to call its sample at. they're run
+        # between the events, and never scheduled on the event queue,
+        # so observing a run doesn't change it
+        self.samplers = []
 
-        # start running
-        self.main()
+    def new_call_id(self):
+        self.calls += 1
+        return self.calls - 1
 
     def log(self, entity, event):
-        self._log.append([self.event_q.get_time(), str(entity.__class__),
-                          entity.id, event, entity.state])
+        time = self.event_q.get_time()
+        for recorder in self.recorders:
+            recorder.record(time, entity, event)
 
     def main(self):
-        flag = True
-        while flag:
-            try:
-                event = self.event_q.pop()
-                event.subject()
-            except IndexError:
-                flag = False
+        self.run()
         self.run_statistics()
 
-    def run_statistics(self):
-        def _verbose():
-            print "channel stats:"
-            print channel_stats["util"]
-            print "*************************************"
-            print "call stats:"
-            for result in ["success", "failed"]:
-                print result
-                print call_stats[result]
-            for state in ["incoming", "outgoing", "handoff"]:
-                print state
-                print call_stats[state]
+    def run(self, until=None):
+        """
+        :param until: stop once the clock reaches this time, so the
+                      simulation can be checkpointed and run on later
+        :return: whether the simulation is over
+        """
+        profiler = self.profiler
+        dispatcher = None if profiler is None else profiler.dispatch
+        # every event of the simulation comes from new_event
+        while not self.event_q.dispatch(self._step(until), dispatcher,
+                                        recycle=True):
+            time = self.event_q.get_time()
+            for sampler in self.samplers:
+                if sampler.next_sample <= time:
+                    sampler.sample()
+            if until is not None and time >= until:
+                return False
+        if profiler is not None:
+            profiler.finish()
+        if self.trace is not None:
+            self.trace.close(self.event_q.get_time())
+        if self.series is not None:
+            self.series.close(self.event_q.get_time())
+        return True
 
-        def _debug():
-            for cellid, channel in channel_stats.iteritems():
-                if isinstance(cellid, int):
-                    print "*************************************"
-                    print "cell: " + str(cellid)
-                    for channelid, stats in channel.iteritems():
-                        print "\tchannel:\t\t" + str(channelid)
-                        print "\t\toverall free:\t" + str(stats["free"])
-                        print "\t\toverall busy:\t" + str(stats["busy"])
-                        print "\t\tutilization:\t" + str(stats["utilization"])
+    def _step(self, until):
+        """
+        :return: the time to dispatch up to, until or the next sample
+        """
+        for sampler in self.samplers:
+            if until is None or sampler.next_sample < until:
+                until = sampler.next_sample
+        return until
 
-        def _prod():
-            handoff_fail_rate = 1.0 - call_stats["handoff"]["success rate"]
-            initiated_fail_rate = float(call_stats["incoming"]["failed"] \
-                                        + call_stats["outgoing"]["failed"]) \
-                                  / (call_stats["incoming"]["total"] \
-                                     + call_stats["outgoing"]["total"])
-            channel_utilization   = channel_stats["util"]["avg"]
-            handoff_avg_pending   = call_stats["handoff"]["total pending"] \
-                                    / call_stats["handoff"]["total"]
-            initiated_avg_pending = float(call_stats["incoming"]["total pending"] \
-                                          + call_stats["outgoing"]["total pending"]) \
-                                    / (call_stats["incoming"]["total"] \
-                                       + call_stats["outgoing"]["total"])
-            print str(handoff_fail_rate) + "," + \
-                  str(initiated_fail_rate) + "," + \
-                  str(channel_utilization) + "," + \
-                  str(handoff_avg_pending) + "," + \
-                  str(initiated_avg_pending)
+    def run_to_precision(self, precision, interval=600, batches=20,
+                         confidence=0.95):
+        """
+        run until the overall statistics reach a relative confidence
+        half width, or until END_TIME, whichever comes first. the
+        warm-up transient is detected and left out of the statistics
+        :param precision: the relative half width to reach, e.g. 0.05
+        :param interval: simulated seconds between samples of the statistics
+        :param batches: number of batches for the batch means
+        :return: the monitor of the run, with the mean and half width of
+                 every statistic over the whole run (summary), whether
+                 they reached the precision (converged) and the warm-up
+                 it discarded
+        :rtype: ConvergenceMonitor
+        """
+        monitor = ConvergenceMonitor(self, precision, interval, batches,
+                                     confidence)
+        self.run()
+        monitor.finish()
+        return monitor
 
-        channel_stats = self._channel_statistics()
-        call_stats = self._call_statistics()
+    def profile(self, sample_interval=60*60, profile_window=None):
+        """
+        time the events from now on, see profiler.Profiler
+        :return: the profiler
+        :rtype: Profiler
+        """
+        from profiler import Profiler
+        self.profiler = Profiler(self, sample_interval, profile_window)
+        return self.profiler
 
-        # show overall statistics
-        if DEBUG_LEVEL == 0:
-            _prod()
-        elif DEBUG_LEVEL == 1:
-            _verbose()
-        elif DEBUG_LEVEL == 2:
-            _debug()
+    def track_time_of_day(self, bucket=60*60, period=60*60*24):
+        """
+        keep the statistics of every bucket of the day from now on,
+        see cellnet_statistics.TimeOfDayStatistics
+        :rtype: TimeOfDayStatistics
+        """
+        return TimeOfDayStatistics(self, bucket, period)
 
-    def _channel_statistics(self):
-        # initialize values
-        channel_stats = {
-            y: {
-                x: {
-                    "last state": "free",
-                    "last started": 0,
-                    "free": 0,
-                    "busy": 0,
-                } for x in range(10)
-                } for y in range(7)
-            }
-        # analyze log
-        for line in self._log:
-            if str(line[1]).endswith("Channel"):
-                time, classname, id, event, state = line
-                # make sure state actually changed
-                cellid = id % 10
-                channelid = id / 10
-                last_state = channel_stats[cellid][channelid]["last state"]
-                if last_state != state:
-                    channel_stats[cellid][channelid][last_state] += \
-                        time - channel_stats[cellid][channelid]["last started"]
-                else:
-                    print "something fishy in log"
-                channel_stats[cellid][channelid]["last state"] = state
-                channel_stats[cellid][channelid]["last started"] = time
-        # now we need to consider the fact that the last state
-        # lasted to the end
-        for cellid, channel in channel_stats.iteritems():
-            for channelid, stats in channel.iteritems():
-                last_state = channel_stats[cellid][channelid]["last state"]
-                channel_stats[cellid][channelid][last_state] += \
-                    self.event_q.get_time() - channel_stats[cellid][channelid]["last started"]
-                channel_stats[cellid][channelid]["utilization"] = \
-                    stats["busy"] / (stats["free"] + stats["busy"])
-        # and now - let's wrap it up
-        utilizations = [
-            channel_stats[cellid][channelid]["utilization"]
-            for cellid in range(7)
-            for channelid in range(10)
-            ]
-        channel_stats["util"] = {
-            "avg": mean(utilizations),
-            "var": var(utilizations),
-        }
+    def reseed(self, seed):
+        """
+        draw new random numbers from now on, e.g. to fork different
+        branches out of one restored checkpoint
+        """
+        self.random.seed(seed)
+        self.variates.reseed(seed)
+
+    def checkpoint(self, path):
+        """
+        save the full state of the simulation, see restore
+        """
+        with open(path, "wb") as checkpoint_file:
+            cPickle.dump(self, checkpoint_file, cPickle.HIGHEST_PROTOCOL)
+
+    def run_statistics(self):
+        channel_stats = self.stats.channel_statistics(self.event_q.get_time())
+        call_stats = self.stats.call_statistics()
+        report(channel_stats, call_stats)
 
-        return channel_stats
+    def prod_metrics(self):
+        """
+        :return: the overall statistics, as listed in PROD_METRICS
+        """
+        channel_stats = self.stats.channel_statistics(self.event_q.get_time())
+        call_stats = self.stats.call_statistics()
+        return prod_metrics(channel_stats, call_stats)
+
+    def _channel_statistics(self):
+        """
+        compute the channel stats from the full log (see keep_log)
+        """
+        return self._log.channel_statistics(self.event_q.get_time())
 
     def _call_statistics(self):
-        # internal methods
-        def _parse_talk():
-            if call_stats.has_key(callid) and \
-                            call_stats[callid]["last pending"] > \
-                            call_stats[callid]["last time"]:
-                pending = time - call_stats[callid]["last pending"]
-                call_stats[callid]["total pending"] += pending
-                call_stats[state]["total pending"] += pending
-            elif call_stats.has_key(callid):
-                pass
-            else:
-                _initialize_call()
-            call_stats[callid]["last time"] = time
+        """
+        compute the call stats from the full log (see keep_log)
+        """
+        return self._log.call_statistics()
+
+
+def restore(path, trace_path=None):
+    """
+    :param trace_path: where the restored run writes its trace, if the
+                       original had one. it starts as a copy of the
+                       original trace up to the checkpoint. None to
+                       stop tracing
+    :return: the simulation saved at path by CellnetSimulation.checkpoint.
+             running it goes on exactly as the original would have
+    """
+    with open(path, "rb") as checkpoint_file:
+        simulation = cPickle.load(checkpoint_file)
+    if simulation.trace is not None:
+        if trace_path is None:
+            simulation.recorders.remove(simulation.trace)
+            simulation.trace = None
+        else:
+            simulation.trace.resume(trace_path)
+    return simulation
+
 
-        def _parse_success():
-            talk = time - call_stats[callid]["last time"]
-            call_stats[callid]["total talk"] += talk
-            call_stats[state]["total talk"] += talk
-            call_stats["success"]["count"] += 1
-            call_stats["success"]["total talk"] += \
-                call_stats[callid]["total talk"]
-            call_stats["success"]["total pending"] += \
-                call_stats[callid]["total pending"]
-            call_stats[state]["success"] += 1
+def _reduce_method(method):
+    # the event queue schedules bound methods, which pickle can't handle
+    return getattr, (method.im_self, method.im_func.__name__)
 
-        def _parse_failed():
-            pending = time - call_stats[callid]["last pending"]
-            call_stats[callid]["total pending"] += pending
-            call_stats[state]["total pending"] += pending
-            call_stats["failed"]["count"] += 1
-            call_stats["failed"]["total talk"] += \
-                call_stats[callid]["total talk"]
-            call_stats["failed"]["total pending"] += \
-                call_stats[callid]["total pending"]
-            call_stats[state]["failed"] += 1
+copy_reg.pickle(types.MethodType, _reduce_method)
 
-        def _parse_handoff():
-            if call_stats[callid]["last time"] > \
-                    call_stats[callid]["last pending"]:
-                talk = time - call_stats[callid]["last time"]
-                call_stats[callid]["total talk"] += talk
-                call_stats[state]["total talk"] += talk
-            else:
-                pending = time - call_stats[callid]["last pending"]
-                call_stats[callid]["total pending"] += pending
-                call_stats[state]["total pending"] += pending
-                call_stats[callid]["last time"] = line[0]
-            call_stats[state]["handoff"] += 1
 
-        def _parse_pending():
-            if call_stats.has_key(callid) and \
-                            call_stats[callid]["last time"] > \
-                            call_stats[callid]["last pending"]:
-                talk = time - call_stats[callid]["last time"]
-                call_stats[callid]["total talk"] += talk
-                call_stats[state]["total talk"] += talk
-            elif call_stats.has_key(callid):
-                pass
-            else:
-                _initialize_call()
-            call_stats[callid]["last pending"] = time
+def cli(argv=None):
+    """
+    the command line of the simulation, see --help
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="simulate the network")
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    parser.add_argument("--end-time", type=float, default=None,
+                        help="simulated seconds to run, see END_TIME")
+    parser.add_argument("--precision", type=float, default=None,
+                        help="stop once the overall statistics reach this "
+                             "relative confidence half width")
+    parser.add_argument("--interval", type=float, default=600,
+                        help="simulated seconds between samples, "
+                             "with --precision")
+    parser.add_argument("--arrivals", metavar="PROFILE", default=None,
+                        help="the arrival profile, see ARRIVAL_PROFILE")
+    parser.add_argument("--time-of-day", type=float, default=None,
+                        metavar="SECONDS",
+                        help="report the statistics of every bucket of "
+                             "this many seconds of the day")
+    parser.add_argument("--series", metavar="PATH", default=None,
+                        help="write the time series of every cell to PATH "
+                             "(.npz or .csv)")
+    parser.add_argument("--series-interval", type=float, default=10*60,
+                        help="seconds in every interval of --series")
+    parser.add_argument("--profile", metavar="PATH", default=None,
+                        help="time the event loop, and export it to PATH "
+                             "(.json or .csv)")
+    parser.add_argument("--cprofile", metavar="START:END", default=None,
+                        help="run cProfile between these simulated times")
+    args = parser.parse_args(argv)
+    parameters = {}
+    if args.end_time is not None:
+        parameters["END_TIME"] = args.end_time
+    if args.arrivals is not None:
+        parameters["ARRIVAL_PROFILE"] = args.arrivals
 
-        def _initialize_call():
-            call_stats[callid] = {
-                "total talk": 0,
-                "total pending": 0,
-                "last time": -1,
-                "last pending": -1,
-            }
-        # initialize values
-        call_stats = {
-            "success": {
-                "count": 0,
-                "total talk": 0,
-                "total pending": 0,
-            },
-            "failed": {
-                "count": 0,
-                "total talk": 0,
-                "total pending": 0,
-            },
-            "incoming": {
-                "success": 0,
-                "failed": 0,
-                "handoff": 0,
-                "total talk": 0,
-                "total pending": 0,
-            },
-            "outgoing": {
-                "success": 0,
-                "failed": 0,
-                "handoff": 0,
-                "total talk": 0,
-                "total pending": 0,
-            },
-            "handoff": {
-                "success": 0,
-                "failed": 0,
-                "handoff": 0,
-                "total talk": 0,
-                "total pending": 0,
-            },
-        }
-        # analyze log
-        for line in self._log:
-            if str(line[1]).endswith("Call"):
-                # make sure state actually changed
-                time, classname, callid, event, state = line
-                if event == CellnetSimulation.TALK:
-                    _parse_talk()
-                elif event == CellnetSimulation.SUCCESS:
-                    _parse_success()
-                elif event == CellnetSimulation.FAILED:
-                    _parse_failed()
-                elif event == CellnetSimulation.HANDOFF:
-                    _parse_handoff()
-                elif event == CellnetSimulation.PENDING:
-                    _parse_pending()
-        # compute averages
-        for result in ["success", "failed"]:
-            if not call_stats[result]["count"] == 0:
-                call_stats[result]["avg talk"] = \
-                    call_stats[result]["total talk"] / call_stats[result]["count"]
-                call_stats[result]["avg pending"] = \
-                    call_stats[result]["total pending"] / call_stats[result]["count"]
-        for state in ["incoming", "outgoing", "handoff"]:
-            count = 0
-            for value in ["success", "failed", "handoff"]:
-                count += call_stats[state][value]
-            call_stats[state]["total"] = count
-            call_stats[state]["success rate"] = float(call_stats[state]["success"] \
-                                                        + call_stats[state]["handoff"]) \
-                                                  / call_stats[state]["total"]
-        return call_stats
+    if args.series is not None:
+        simulation = CellnetSimulation(parameters, seed=args.seed,
+                                       series_interval=args.series_interval)
+        simulation.main()
+        simulation.series.write(args.series)
+    elif args.time_of_day is not None:
+        simulation = CellnetSimulation(parameters, seed=args.seed)
+        time_of_day = simulation.track_time_of_day(args.time_of_day)
+        simulation.run()
+        print "start," + ",".join(PROD_METRICS)
+        for start, metrics in time_of_day.statistics(
+                simulation.event_q.get_time()):
+            print str(start) + "," + ",".join(str(metric)
+                                              for metric in metrics)
+    elif args.profile is not None or args.cprofile is not None:
+        simulation = CellnetSimulation(parameters, seed=args.seed)
+        window = None
+        if args.cprofile is not None:
+            window = tuple(float(time) for time in args.cprofile.split(":"))
+        profiler = simulation.profile(profile_window=window)
+        simulation.main()
+        if args.profile is not None:
+            profiler.export(args.profile)
+        if window is not None:
+            profiler.print_profile()
+    elif args.precision is None:
+        CellnetSimulation(parameters, seed=args.seed).main()
+    else:
+        # END_TIME is only the longest the run may take
+        simulation = CellnetSimulation(parameters, seed=args.seed)
+        monitor = simulation.run_to_precision(args.precision, args.interval)
+        if monitor.summary is None:
+            raise SystemExit("END_TIME is too short to estimate the precision")
+        print "metric,mean,half_width"
+        for metric, (mean, half_width) in zip(PROD_METRICS, monitor.summary):
+            print metric + "," + str(mean) + "," + str(half_width)
+        print "warmup," + str(monitor.warmup_time())
+        print "end_time," + str(simulation.event_q.get_time())
+        print "converged," + str(monitor.converged)
+        if not monitor.converged:
+            raise SystemExit("the precision wasn't reached by END_TIME")
 
 
-simulation = CellnetSimulation()  # there can be only one
+if __name__ == "__main__":
+    cli()
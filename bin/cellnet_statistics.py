@@ -0,0 +1,418 @@
+#! /usr/bin/python
+
+"""
+this module computes the simulation statistics online,
+while the events happen, so we don't need to keep the log
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+from math import fsum
+from config import DEBUG_LEVEL
+
+# the "enum" part of the simulation, for the log
+# Call enum
+TALK = 1
+SUCCESS = 2
+FAILED = 3
+HANDOFF = 4
+PENDING = 5
+# Channel enum
+FREE = 11
+BUSY = 12
+
+CALL_EVENTS = [TALK, SUCCESS, FAILED, HANDOFF, PENDING]
+CHANNEL_EVENTS = [FREE, BUSY]
+
+# the states of channels and calls, the code of each one is its index
+STATES = ["free", "busy", "incoming", "outgoing", "handoff"]
+
+# the overall statistics, in the order of the production report
+PROD_METRICS = [
+    "handoff_fail_rate",
+    "initiated_fail_rate",
+    "channel_utilization",
+    "handoff_avg_pending",
+    "initiated_avg_pending",
+]
+
+
+def new_call_stats():
+    return {
+        "success": {
+            "count": 0,
+            "total talk": 0,
+            "total pending": 0,
+        },
+        "failed": {
+            "count": 0,
+            "total talk": 0,
+            "total pending": 0,
+        },
+        "incoming": {
+            "success": 0,
+            "failed": 0,
+            "handoff": 0,
+            "total talk": 0,
+            "total pending": 0,
+        },
+        "outgoing": {
+            "success": 0,
+            "failed": 0,
+            "handoff": 0,
+            "total talk": 0,
+            "total pending": 0,
+        },
+        "handoff": {
+            "success": 0,
+            "failed": 0,
+            "handoff": 0,
+            "total talk": 0,
+            "total pending": 0,
+        },
+    }
+
+
+def ratio(numerator, denominator):
+    """
+    :return: numerator / denominator, or nan if nothing was counted,
+             e.g. no handoff completed in a short run
+    """
+    if not denominator:
+        return float("nan")
+    return float(numerator) / denominator
+
+
+def mean(values):
+    return fsum(values) / values.__len__()
+
+
+def var(values):
+    """
+    :return: the variance of the values, as a population
+    """
+    average = mean(values)
+    return fsum((value - average) ** 2 for value in values) / values.__len__()
+
+
+def summarize_channels(channel_stats):
+    """
+    add the utilization of every channel, and the overall "util"
+    entry, to channel stats whose free and busy times are final
+    """
+    for cellid, channel in channel_stats.iteritems():
+        for channelid, stats in channel.iteritems():
+            stats["utilization"] = \
+                ratio(stats["busy"], stats["free"] + stats["busy"])
+    utilizations = [
+        channel_stats[cellid][channelid]["utilization"]
+        for cellid in range(channel_stats.__len__())
+        for channelid in range(channel_stats[cellid].__len__())
+        ]
+    channel_stats["util"] = {
+        "avg": mean(utilizations),
+        "var": var(utilizations),
+    }
+    return channel_stats
+
+
+def summarize_calls(call_stats):
+    """
+    add averages and success rates to final call stats
+    """
+    for result in ["success", "failed"]:
+        if not call_stats[result]["count"] == 0:
+            call_stats[result]["avg talk"] = \
+                call_stats[result]["total talk"] / call_stats[result]["count"]
+            call_stats[result]["avg pending"] = \
+                call_stats[result]["total pending"] / call_stats[result]["count"]
+    for state in ["incoming", "outgoing", "handoff"]:
+        count = 0
+        for value in ["success", "failed", "handoff"]:
+            count += call_stats[state][value]
+        call_stats[state]["total"] = count
+        call_stats[state]["success rate"] = ratio(call_stats[state]["success"] \
+                                                  + call_stats[state]["handoff"],
+                                                  call_stats[state]["total"])
+    return call_stats
+
+
+def prod_metrics(channel_stats, call_stats):
+    """
+    :return: the overall statistics, as listed in PROD_METRICS
+    """
+    handoff_fail_rate = 1.0 - call_stats["handoff"]["success rate"]
+    initiated_fail_rate = ratio(call_stats["incoming"]["failed"] \
+                                + call_stats["outgoing"]["failed"],
+                                call_stats["incoming"]["total"] \
+                                + call_stats["outgoing"]["total"])
+    channel_utilization   = channel_stats["util"]["avg"]
+    handoff_avg_pending   = ratio(call_stats["handoff"]["total pending"],
+                                  call_stats["handoff"]["total"])
+    initiated_avg_pending = ratio(call_stats["incoming"]["total pending"] \
+                                  + call_stats["outgoing"]["total pending"],
+                                  call_stats["incoming"]["total"] \
+                                  + call_stats["outgoing"]["total"])
+    return handoff_fail_rate, initiated_fail_rate, channel_utilization, \
+        handoff_avg_pending, initiated_avg_pending
+
+
+def report(channel_stats, call_stats, debug_level=DEBUG_LEVEL):
+    """
+    print the statistics, as detailed as the debug level asks for
+    """
+    def _verbose():
+        print "channel stats:"
+        print channel_stats["util"]
+        print "*************************************"
+        print "call stats:"
+        for result in ["success", "failed"]:
+            print result
+            print call_stats[result]
+        for state in ["incoming", "outgoing", "handoff"]:
+            print state
+            print call_stats[state]
+
+    def _debug():
+        for cellid, channel in channel_stats.iteritems():
+            if isinstance(cellid, int):
+                print "*************************************"
+                print "cell: " + str(cellid)
+                for channelid, stats in channel.iteritems():
+                    print "\tchannel:\t\t" + str(channelid)
+                    print "\t\toverall free:\t" + str(stats["free"])
+                    print "\t\toverall busy:\t" + str(stats["busy"])
+                    print "\t\tutilization:\t" + str(stats["utilization"])
+
+    def _prod():
+        print ",".join(str(metric)
+                       for metric in prod_metrics(channel_stats, call_stats))
+
+    # show overall statistics
+    if debug_level == 0:
+        _prod()
+    elif debug_level == 1:
+        _verbose()
+    elif debug_level == 2:
+        _debug()
+
+
+class OnlineStatistics:
+    """
+    accumulates the same numbers CellnetSimulation used to parse out
+    of its log, one event at a time. it only remembers the channels
+    and the calls that are still active
+    """
+
+    def __init__(self, cells=7, channels=10):
+        """
+        :param cells: number of cells in the network
+        :param channels: number of channels in every cell
+        """
+        self.cells = cells
+        self.channels_per_cell = channels
+        # for each channel: [last state, last started, free, busy]
+        self.channels = {}
+        self.call_stats = new_call_stats()
+        # for each active call: [total talk, total pending,
+        #                        last time, last pending]
+        self.calls = {}
+        self._call_parsers = {
+            TALK: self._parse_talk,
+            SUCCESS: self._parse_success,
+            FAILED: self._parse_failed,
+            HANDOFF: self._parse_handoff,
+            PENDING: self._parse_pending,
+        }
+
+    def record(self, time, entity, event):
+        if event in CHANNEL_EVENTS:
+            self._parse_channel(time, entity.id, STATES[entity.state])
+        else:
+            self._call_parsers[event](time, entity.id, STATES[entity.state])
+
+    def _parse_channel(self, time, id, state):
+        channel = self.channels.get(id)
+        if channel is None:
+            channel = self.channels[id] = ["free", 0, 0, 0]
+        # make sure state actually changed
+        if channel[0] != state:
+            if channel[0] == "free":
+                channel[2] += time - channel[1]
+            else:
+                channel[3] += time - channel[1]
+        else:
+            print "something fishy in log"
+        channel[0] = state
+        channel[1] = time
+
+    def _parse_talk(self, time, callid, state):
+        call = self.calls.get(callid)
+        if call is None:
+            call = self.calls[callid] = [0, 0, -1, -1]
+        elif call[3] > call[2]:
+            pending = time - call[3]
+            call[1] += pending
+            self.call_stats[state]["total pending"] += pending
+        call[2] = time
+
+    def _parse_success(self, time, callid, state):
+        call = self.calls.pop(callid)
+        talk = time - call[2]
+        call[0] += talk
+        self.call_stats[state]["total talk"] += talk
+        self.call_stats["success"]["count"] += 1
+        self.call_stats["success"]["total talk"] += call[0]
+        self.call_stats["success"]["total pending"] += call[1]
+        self.call_stats[state]["success"] += 1
+
+    def _parse_failed(self, time, callid, state):
+        call = self.calls.pop(callid)
+        pending = time - call[3]
+        call[1] += pending
+        self.call_stats[state]["total pending"] += pending
+        self.call_stats["failed"]["count"] += 1
+        self.call_stats["failed"]["total talk"] += call[0]
+        self.call_stats["failed"]["total pending"] += call[1]
+        self.call_stats[state]["failed"] += 1
+
+    def _parse_handoff(self, time, callid, state):
+        call = self.calls[callid]
+        if call[2] > call[3]:
+            talk = time - call[2]
+            call[0] += talk
+            self.call_stats[state]["total talk"] += talk
+        else:
+            pending = time - call[3]
+            call[1] += pending
+            self.call_stats[state]["total pending"] += pending
+            call[2] = time
+        self.call_stats[state]["handoff"] += 1
+
+    def _parse_pending(self, time, callid, state):
+        call = self.calls.get(callid)
+        if call is None:
+            call = self.calls[callid] = [0, 0, -1, -1]
+        elif call[2] > call[3]:
+            talk = time - call[2]
+            call[0] += talk
+            self.call_stats[state]["total talk"] += talk
+        call[3] = time
+
+    def forget(self, callid):
+        """
+        drop an active call, that goes on in another simulation
+        """
+        self.calls.pop(callid, None)
+
+    def totals(self, time):
+        """
+        :return: the numerator and the denominator of every statistic
+                 in PROD_METRICS, summed from the start up to time
+        """
+        call_stats = self.call_stats
+        handoff = call_stats["handoff"]
+        initiated = [call_stats["incoming"], call_stats["outgoing"]]
+        handoff_total = handoff["success"] + handoff["failed"] + \
+            handoff["handoff"]
+        initiated_total = sum(stats["success"] + stats["failed"] +
+                              stats["handoff"] for stats in initiated)
+        busy = 0
+        for last_state, last_started, free, channel_busy in \
+                self.channels.itervalues():
+            busy += channel_busy
+            if last_state == "busy":
+                busy += time - last_started
+        channels = self.cells * self.channels_per_cell
+        return [
+            (handoff["failed"], handoff_total),
+            (sum(stats["failed"] for stats in initiated), initiated_total),
+            (busy, channels * time),
+            (handoff["total pending"], handoff_total),
+            (sum(stats["total pending"] for stats in initiated),
+             initiated_total),
+        ]
+
+    def channel_statistics(self, end_time):
+        """
+        :param end_time: the time the last state of every channel lasted to
+        :return: the channel stats, as if the simulation ended at end_time
+        """
+        channel_stats = {}
+        for cellid in range(self.cells):
+            channel_stats[cellid] = {}
+            for channelid in range(self.channels_per_cell):
+                last_state, last_started, free, busy = self.channels.get(
+                    cellid * self.channels_per_cell + channelid,
+                    ["free", 0, 0, 0])
+                # the last state lasted to the end
+                if last_state == "free":
+                    free += end_time - last_started
+                else:
+                    busy += end_time - last_started
+                channel_stats[cellid][channelid] = {
+                    "last state": last_state,
+                    "last started": last_started,
+                    "free": free,
+                    "busy": busy,
+                }
+        return summarize_channels(channel_stats)
+
+    def call_statistics(self):
+        call_stats = dict((key, dict(value))
+                          for key, value in self.call_stats.iteritems())
+        return summarize_calls(call_stats)
+
+
+class TimeOfDayStatistics:
+    def __init__(self, simulation, bucket=60*60, period=60*60*24):
+        """
+        the overall statistics of every bucket of the day, over all
+        the days of the run, e.g. to find the busy hour
+        :param bucket: seconds in every bucket
+        :param period: seconds in a day, a multiple of bucket
+        """
+        self.simulation = simulation
+        self.bucket = bucket
+        self.period = period
+        # for every bucket, the numerator and the denominator
+        # of every statistic in PROD_METRICS
+        self.sums = [[[0, 0] for _ in PROD_METRICS]
+                     for _ in range(int(period // bucket))]
+        self.last_time = simulation.event_q.get_time()
+        self.last_totals = simulation.stats.totals(self.last_time)
+        # sampled by the simulation as it runs,
+        # whenever a bucket starts, on a multiple of bucket
+        self.next_sample = self.last_time - self.last_time % bucket + bucket
+        simulation.samplers.append(self)
+
+    def _index(self, time):
+        return int(time % self.period // self.bucket)
+
+    def sample(self):
+        time = self.simulation.event_q.get_time()
+        totals = self.simulation.stats.totals(time)
+        self._add(self.sums[self._index(self.last_time)], totals)
+        self.last_time = time
+        self.last_totals = totals
+        self.next_sample += self.bucket
+
+    def _add(self, sums, totals):
+        for sum_, (numerator, denominator), (last_numerator, last_denominator) \
+                in zip(sums, totals, self.last_totals):
+            sum_[0] += numerator - last_numerator
+            sum_[1] += denominator - last_denominator
+
+    def statistics(self, end_time):
+        """
+        :param end_time: the time the current bucket lasted to
+        :return: for every bucket, its start in seconds into the day and
+                 the statistics of PROD_METRICS, nan where nothing happened
+        """
+        sums = [[list(sum_) for sum_ in bucket] for bucket in self.sums]
+        self._add(sums[self._index(self.last_time)],
+                  self.simulation.stats.totals(end_time))
+        return [(i * self.bucket,
+                 tuple(ratio(numerator, denominator)
+                       for numerator, denominator in bucket))
+                for i, bucket in enumerate(sums)]
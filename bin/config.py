@@ -14,4 +14,52 @@ TALK_MEAN = 20*60
 TALK_VAR = 5*60
 ARRIVE_MEAN = 1
 ARRIVE_SCALE = 60
+CHANNELS = 10
+# most calls waiting for a channel in a cell, None for no limit. a call
+# that finds the queue full fails at once
+PENDING_CAPACITY = None
+# whether pending handoffs get a channel before pending new calls
+HANDOFF_PRIORITY = False
+# None for a constant rate, or "table:HOUR=RATE;..." or "file:PATH",
+# with rates in calls per hour (see arrival_profile)
+ARRIVAL_PROFILE = None
+# "full:CELLS", "hex:ROWSxCOLS" or "file:PATH" (see topology)
+TOPOLOGY = "full:7"
 DEBUG_LEVEL = 0
+KEEP_LOG = False
+TRACE_PATH = None
+# seconds in every interval of the time series of the cells, or None
+SERIES_INTERVAL = None
+
+# the parameters of the model, which every simulation may override
+PARAMETERS = [
+    "END_TIME",
+    "INITIAL_GIVEUP_TIME",
+    "HANDOFF_GIVEUP_TIME",
+    "HANDOFF_RATIO",
+    "TALK_MEAN",
+    "TALK_VAR",
+    "ARRIVE_MEAN",
+    "ARRIVE_SCALE",
+    "CHANNELS",
+    "PENDING_CAPACITY",
+    "HANDOFF_PRIORITY",
+    "TOPOLOGY",
+    "ARRIVAL_PROFILE",
+]
+
+
+class Parameters:
+    def __init__(self, **overrides):
+        """
+        the parameters of one simulation: the values above,
+        except for the overridden ones
+        """
+        unknown = set(overrides) - set(PARAMETERS)
+        if unknown:
+            raise KeyError("unknown parameters: " + ", ".join(sorted(unknown)))
+        for name in PARAMETERS:
+            setattr(self, name, overrides.get(name, globals()[name]))
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in PARAMETERS)
@@ -0,0 +1,210 @@
+#! /usr/bin/python
+
+"""
+this module decides how long a simulation should run: it detects the
+end of the warm-up transient (MSER-5), and stops the run once the
+overall statistics are as precise as asked for (batch means)
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+from math import exp, lgamma, log, sqrt
+from cellnet_statistics import PROD_METRICS
+
+# every check of the convergence looks at all the samples so far, so the
+# checks are spread out: the next one is at least this much further on
+CHECK_GROWTH = 1.1
+
+
+def mser5(series):
+    """
+    the MSER-5 truncation rule: average the series in batches of 5, and
+    drop the number of batches d that minimizes the squared standard
+    error of the rest, sum((y - mean)^2) / (n - d)^2. d is at most n / 2
+    :return: the number of observations to drop from the start
+    """
+    batches = [sum(series[i:i + 5]) / 5.0
+               for i in xrange(0, series.__len__() - 4, 5)]
+    n = batches.__len__()
+    # sums of the batches and of their squares, from the end backwards,
+    # so every truncation is checked in constant time
+    total, squares = 0.0, 0.0
+    best, truncation = None, 0
+    for d in xrange(n - 1, -1, -1):
+        total += batches[d]
+        squares += batches[d] ** 2
+        count = n - d
+        if count < 2 or d > n / 2:
+            continue
+        error = (squares - total ** 2 / count) / count ** 2
+        if best is None or error <= best:
+            best, truncation = error, d
+    return truncation * 5
+
+
+def batch_means(numerators, denominators, batches, confidence=0.95):
+    """
+    estimate a ratio, and a confidence interval for it, out of a series
+    of intervals. the intervals are grouped into consecutive batches,
+    and the ratio of every batch is taken as one observation
+    :return: the overall ratio and the half width of its interval
+    """
+    size = numerators.__len__() / batches
+    ratios = []
+    for i in xrange(batches):
+        numerator = sum(numerators[i * size:(i + 1) * size])
+        denominator = sum(denominators[i * size:(i + 1) * size])
+        ratios.append(float(numerator) / denominator if denominator else 0.0)
+    mean = float(sum(numerators)) / sum(denominators) if sum(denominators) else 0.0
+    std = sqrt(sum((ratio - sum(ratios) / batches) ** 2 for ratio in ratios)
+               / (batches - 1))
+    return mean, t_quantile((1 + confidence) / 2.0, batches - 1) \
+        * std / sqrt(batches)
+
+
+class ConvergenceMonitor:
+    def __init__(self, simulation, precision, interval=600, batches=20,
+                 confidence=0.95):
+        """
+        samples the statistics of the simulation every interval, and
+        ends it once the confidence half width of every overall
+        statistic, after the warm-up, is within precision of its mean
+        :param precision: the relative half width to reach
+        :param interval: simulated seconds between samples
+        :param batches: number of batches for the batch means
+        """
+        self.simulation = simulation
+        self.precision = precision
+        self.interval = interval
+        self.batches = batches
+        self.confidence = confidence
+        # the totals of the statistics at every sample,
+        # and what every interval added to them
+        self.last_totals = None
+        self.numerators = [[] for _ in PROD_METRICS]
+        self.denominators = [[] for _ in PROD_METRICS]
+        self.warmup = 0
+        self.summary = None
+        # whether every statistic reached the precision
+        self.converged = False
+        self.next_check = batches
+        # sampled by the simulation as it runs
+        self.next_sample = simulation.event_q.get_time() + interval
+        simulation.samplers.append(self)
+
+    def sample(self):
+        totals = self.simulation.stats.totals(self.simulation.event_q.get_time())
+        if self.last_totals is not None:
+            for i, (numerator, denominator) in enumerate(totals):
+                last_numerator, last_denominator = self.last_totals[i]
+                self.numerators[i].append(numerator - last_numerator)
+                self.denominators[i].append(denominator - last_denominator)
+        self.last_totals = totals
+        if self._check():
+            self.converged = True
+            # let the event queue know the simulation is over
+            self.simulation.event_q.end_time = \
+                self.simulation.event_q.get_time()
+        self.next_sample += self.interval
+
+    def _series(self, i):
+        return [float(numerator) / denominator if denominator else 0.0
+                for numerator, denominator
+                in zip(self.numerators[i], self.denominators[i])]
+
+    def _check(self):
+        # checking is as expensive as the samples so far, so it's done
+        # on a geometric schedule, and the whole run stays linear
+        samples = self.numerators[0].__len__()
+        if samples < self.next_check:
+            return False
+        self.next_check = max(samples + self.batches,
+                              int(samples * CHECK_GROWTH))
+        return self.estimate()
+
+    def finish(self):
+        """
+        summarize all the samples, once the run is over. a run that
+        didn't converge on a check may end with fresher estimates
+        """
+        if not self.converged:
+            self.converged = self.estimate()
+
+    def estimate(self):
+        """
+        detect the warm-up, and summarize the samples after it
+        :return: whether every statistic is within the precision
+        """
+        samples = self.numerators[0].__len__()
+        # the warm-up ends when both utilization and blocking settled
+        self.warmup = max(
+            mser5(self._series(PROD_METRICS.index("channel_utilization"))),
+            mser5(self._series(PROD_METRICS.index("initiated_fail_rate"))))
+        if samples - self.warmup < 5 * self.batches:
+            self.summary = None
+            return False
+        self.summary = [
+            batch_means(numerators[self.warmup:], denominators[self.warmup:],
+                        self.batches, self.confidence)
+            for numerators, denominators
+            in zip(self.numerators, self.denominators)]
+        return all(half_width <= self.precision * abs(mean)
+                   for mean, half_width in self.summary)
+
+    def warmup_time(self):
+        """
+        :return: the simulated time that was discarded as warm-up
+        """
+        return (self.warmup + 1) * self.interval
+
+
+def t_quantile(p, df):
+    """
+    the p quantile of Student's t distribution, by bisection on its cdf
+    """
+    low, high = -1.0, 1.0
+    while t_cdf(low, df) > p:
+        low *= 2
+    while t_cdf(high, df) < p:
+        high *= 2
+    for _ in xrange(100):
+        middle = (low + high) / 2
+        if t_cdf(middle, df) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+def t_cdf(t, df):
+    tail = _incomplete_beta(df / 2.0, 0.5, df / (df + t * t)) / 2
+    return 1 - tail if t > 0 else tail
+
+
+def _incomplete_beta(a, b, x):
+    """
+    the regularized incomplete beta function, by continued fraction
+    """
+    if x <= 0 or x >= 1:
+        return float(x >= 1)
+    front = exp(lgamma(a + b) - lgamma(a) - lgamma(b)
+                + a * log(x) + b * log(1 - x))
+    if x > (a + 1) / (a + b + 2):
+        return 1 - _incomplete_beta(b, a, 1 - x)
+    # Lentz's algorithm
+    tiny = 1e-300
+    c, d = 1.0, 1 - (a + b) * x / (a + 1)
+    d = 1 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in xrange(1, 300):
+        for numerator in [m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x
+                          / ((a + 2 * m) * (a + 2 * m + 1))]:
+            d = 1 + numerator * d
+            d = 1 / (d if abs(d) > tiny else tiny)
+            c = 1 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            fraction *= c * d
+        if abs(c * d - 1) < 1e-15:
+            break
+    return front * fraction / a
@@ -0,0 +1,149 @@
+#! /usr/bin/python
+
+"""
+this module computes analytic estimates for the simulation, treating
+every cell as an M/M/c queue whose calls give up after a fixed time
+(M/M/c+D). all the functions are vectorized: any argument may be a
+NumPy array, and they're broadcast against each other, so a whole
+parameter grid is evaluated at once
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import numpy
+from topology import build_topology
+
+
+def erlang_b(servers, load):
+    """
+    the blocking probability of an M/M/c/c system (Erlang-B),
+    by the recursion B(k) = a B(k-1) / (k + a B(k-1)), which is
+    stable for any number of servers
+    :param servers: number of servers, c
+    :param load: offered load in Erlangs, a
+    """
+    servers, load = numpy.broadcast_arrays(numpy.asarray(servers),
+                                           numpy.asarray(load, float))
+    blocking = numpy.ones(servers.shape)
+    for k in range(1, int(servers.max()) + 1 if servers.size else 1):
+        blocking = numpy.where(k <= servers,
+                               load * blocking / (k + load * blocking),
+                               blocking)
+    return blocking
+
+
+def erlang_c(servers, load):
+    """
+    the probability to wait in an M/M/c system (Erlang-C),
+    out of Erlang-B. it's 1 when the system is overloaded
+    """
+    servers = numpy.asarray(servers)
+    load = numpy.asarray(load, float)
+    blocking = erlang_b(servers, load)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        waiting = servers * blocking / (servers - load * (1 - blocking))
+    return numpy.where(load < servers, waiting, 1.0)
+
+
+def mmc_deterministic_patience(servers, load, patience, service_rate=1.0):
+    """
+    an M/M/c queue whose customers give up once they waited a fixed time.
+    the virtual waiting time has density lambda p exp(delta x) below the
+    patience, and decays at rate c mu above it, where p is the probability
+    of c-1 busy servers and delta = lambda - c mu.
+    :param servers: number of servers, c
+    :param load: offered load in Erlangs, a = lambda / mu
+    :param patience: time a customer waits before giving up, tau
+    :param service_rate: mu
+    :return: a dict of arrays: "abandon", the probability to give up;
+             "wait", the probability to wait at all; "mean pending",
+             the mean time waited, over all the customers; and
+             "utilization", the fraction of time a server is busy
+    """
+    servers = numpy.asarray(servers, float)
+    load = numpy.asarray(load, float)
+    patience = numpy.asarray(patience, float)
+    mu = numpy.asarray(service_rate, float)
+    arrival_rate = load * mu
+    capacity = servers * mu
+    delta = arrival_rate - capacity
+    exponent = delta * patience
+    # everything is scaled by exp(-max(exponent, 0)), so nothing overflows
+    # when the system is overloaded and the patience is long
+    scale = numpy.exp(-numpy.maximum(exponent, 0))
+    grown = numpy.exp(numpy.minimum(exponent, 0))  # exp(exponent) * scale
+    small = numpy.abs(exponent) < 1e-6
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        # the mass below the patience, and its first moment, over lambda p
+        below = numpy.where(small, patience * scale, (grown - scale) / delta)
+        moment = numpy.where(
+            small, patience ** 2 / 2 * scale,
+            (patience * grown - (grown - scale) / delta) / delta)
+    above = grown / capacity
+    # the states where nobody waits, over p
+    idle = 1 / erlang_b(servers - 1, load) * scale
+    normalization = idle + arrival_rate * (below + above)
+    abandon = arrival_rate * above / normalization
+    wait = arrival_rate * (below + above) / normalization
+    mean_pending = arrival_rate * moment / normalization + patience * abandon
+    return {
+        "abandon": abandon,
+        "wait": wait,
+        "mean pending": mean_pending,
+        "utilization": load * (1 - abandon) / servers,
+    }
+
+
+def cell_estimates(params, iterations=100, tolerance=1e-12):
+    """
+    estimate the overall statistics of the simulation, as listed in
+    PROD_METRICS. handoffs are fed back into the cells, so the load of
+    a cell is found by fixed point iteration. the talk time is taken as
+    exponential, and the patience as the mean of both give-up times,
+    weighted by the share of new calls and handoffs. in the simulation,
+    a call handed off back to its own cell finds the channel it just
+    left, so its handoff failure rate comes out somewhat lower
+    :param params: the parameters to estimate for. every value may be
+                   an array, for a grid of parameters
+    :type params: config.Parameters
+    """
+    if params.ARRIVAL_PROFILE is not None:
+        raise ValueError("the estimates assume a constant arrival rate")
+    if params.PENDING_CAPACITY is not None or params.HANDOFF_PRIORITY:
+        raise ValueError("the estimates assume an unbounded FIFO queue")
+    cells = build_topology(params.TOPOLOGY).cells
+    channels = numpy.asarray(params.CHANNELS, float)
+    handoff = numpy.asarray(params.HANDOFF_RATIO, float)
+    mu = 1.0 / numpy.asarray(params.TALK_MEAN, float)
+    new_rate = numpy.asarray(params.ARRIVE_MEAN, float) \
+        / params.ARRIVE_SCALE / cells
+    abandon = numpy.zeros(numpy.broadcast(channels, handoff, mu,
+                                          new_rate).shape)
+    for _ in range(iterations):
+        # every call that got a channel is handed off with some
+        # probability, to another cell just as loaded
+        rate = new_rate / (1 - handoff * (1 - abandon))
+        handoff_share = 1 - new_rate / rate
+        patience = (1 - handoff_share) * params.INITIAL_GIVEUP_TIME \
+            + handoff_share * params.HANDOFF_GIVEUP_TIME
+        estimates = mmc_deterministic_patience(channels, rate / mu,
+                                               patience, mu)
+        converged = numpy.all(numpy.abs(estimates["abandon"] - abandon)
+                              <= tolerance)
+        abandon = estimates["abandon"]
+        if converged:
+            break
+    return abandon, abandon, estimates["utilization"], \
+        estimates["mean pending"], estimates["mean pending"]
+
+
+def consistent(summary, estimates):
+    """
+    check simulation results against theory
+    :param summary: the mean and confidence half width of every metric,
+                    see runner.summarize
+    :param estimates: the analytic estimates of the metrics
+    :return: for every metric, whether its estimate is in the interval
+    """
+    return [abs(mean - estimate) <= half_width
+            for (mean, half_width), estimate in zip(summary, estimates)]
@@ -0,0 +1,216 @@
+#! /usr/bin/python
+
+"""
+this module holds the full log of the simulation in typed columns,
+and computes the statistics out of them with vectorized operations
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import numpy
+from cellnet_statistics import TALK, SUCCESS, FAILED, HANDOFF, PENDING, \
+    CHANNEL_EVENTS, STATES, new_call_stats, summarize_channels, summarize_calls
+
+# entity kinds
+CHANNEL = 0
+CALL = 1
+
+STATE_CODES = dict((state, code) for code, state in enumerate(STATES))
+
+COLUMNS = [
+    ("time", numpy.float64),
+    ("kind", numpy.uint8),
+    ("id", numpy.int64),
+    ("event", numpy.uint8),
+    ("state", numpy.uint8),
+]
+
+
+class EventLog:
+    def __init__(self, cells=7, channels=10, capacity=2**16):
+        """
+        :param cells: number of cells in the network
+        :param channels: number of channels in every cell
+        :param capacity: number of records to preallocate,
+                         it's doubled whenever the log is full
+        """
+        self.cells = cells
+        self.channels = channels
+        self.size = 0
+        self.capacity = capacity
+        self.columns = dict((name, numpy.empty(capacity, dtype))
+                            for name, dtype in COLUMNS)
+
+    def record(self, time, entity, event):
+        if self.size == self.capacity:
+            self._grow()
+        i = self.size
+        columns = self.columns
+        columns["time"][i] = time
+        columns["kind"][i] = entity_kind(event)
+        columns["id"][i] = entity.id
+        columns["event"][i] = event
+        columns["state"][i] = entity.state
+        self.size += 1
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, column in self.columns.iteritems():
+            grown = numpy.empty(self.capacity, column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name):
+        return self.columns[name][:self.size]
+
+    def channel_statistics(self, end_time):
+        return channel_statistics(self.column("time"), self.column("kind"),
+                                  self.column("id"), self.column("state"),
+                                  end_time, self.cells, self.channels)
+
+    def call_statistics(self):
+        return call_statistics(self.column("time"), self.column("kind"),
+                               self.column("id"), self.column("event"),
+                               self.column("state"))
+
+
+def entity_kind(event):
+    """
+    :return: the kind of entity the event happens to
+    """
+    if event in CHANNEL_EVENTS:
+        return CHANNEL
+    return CALL
+
+
+def _previous(ids):
+    """
+    :return: for every record, the index of the previous record
+             with the same id, or -1 for the first one
+    """
+    order = numpy.argsort(ids, kind="mergesort")
+    previous = numpy.empty(ids.__len__(), numpy.int64)
+    previous[order[1:]] = order[:-1]
+    first = numpy.ones(ids.__len__(), bool)
+    first[1:] = ids[order[1:]] != ids[order[:-1]]
+    previous[order[first]] = -1
+    return previous
+
+
+def _sequential_sum(bins, weights, length):
+    """
+    sum weights per bin in the order they appear, like a python loop
+    would, so the results are exactly the same.
+    bins that got nothing stay an integer 0
+    """
+    sums = numpy.bincount(bins, weights=weights, minlength=length)
+    counts = numpy.bincount(bins, minlength=length)
+    return [float(total) if counted else 0
+            for total, counted in zip(sums, counts)]
+
+
+def channel_statistics(time, kind, id, state, end_time, cells=7, channels=10):
+    """
+    the channel stats, as CellnetSimulation reports them,
+    out of log columns
+    :param cells: number of cells in the network
+    :param channels: number of channels in every cell
+    """
+    logged = kind == CHANNEL
+    time = time[logged]
+    id = id[logged]
+    busy = state[logged] == STATE_CODES["busy"]
+    previous = _previous(id)
+    has_previous = previous >= 0
+    # every channel starts free at time 0. each record closes
+    # the interval that started at the previous record
+    started = numpy.where(has_previous, time[previous], 0)
+    was_busy = has_previous & busy[previous]
+    # and the last state of every channel lasted to the end
+    last = numpy.ones(id.__len__(), bool)
+    last[previous[has_previous]] = False
+    bins = numpy.concatenate([id * 2 + was_busy, id[last] * 2 + busy[last]])
+    durations = numpy.concatenate([time - started, end_time - time[last]])
+    totals = _sequential_sum(bins, durations, 0)
+
+    last_records = dict(zip(id[last], zip(time[last], busy[last])))
+    channel_stats = {}
+    for cellid in range(cells):
+        channel_stats[cellid] = {}
+        for channelid in range(channels):
+            channel = cellid * channels + channelid
+            if channel in last_records:
+                last_started, last_busy = last_records[channel]
+                free, busy = totals[channel * 2], totals[channel * 2 + 1]
+            else:
+                # never allocated, so it was free the whole time
+                last_started, last_busy = 0, False
+                free, busy = end_time, 0
+            channel_stats[cellid][channelid] = {
+                "last state": "busy" if last_busy else "free",
+                "last started": float(last_started),
+                "free": free,
+                "busy": busy,
+            }
+    return summarize_channels(channel_stats)
+
+
+def call_statistics(time, kind, id, event, state):
+    """
+    the call stats, as CellnetSimulation reports them, out of log columns.
+    we rely on the call histories being well formed: a call starts with
+    TALK or PENDING, PENDING is followed by TALK or FAILED, TALK is
+    followed by SUCCESS or HANDOFF, and HANDOFF by TALK or PENDING
+    """
+    logged = kind == CALL
+    time = time[logged]
+    id = id[logged]
+    event = event[logged]
+    state = state[logged]
+    n = time.__len__()
+    previous = _previous(id)
+    has_previous = previous >= 0
+    previous_event = numpy.where(has_previous, event[previous], 0)
+    previous_time = time[previous]
+
+    talk = numpy.zeros(n)
+    pending = numpy.zeros(n)
+    # a talk closes the pending period before it, and so does a failure
+    closes_pending = ((event == TALK) & (previous_event == PENDING)) | \
+                     (event == FAILED)
+    pending[closes_pending] = (time - previous_time)[closes_pending]
+    # success and handoff close the talk before them
+    closes_talk = (event == SUCCESS) | (event == HANDOFF)
+    talk[closes_talk] = (time - previous_time)[closes_talk]
+    # a handoff that ends up pending is counted from the talk that
+    # preceded the handoff, once again
+    talked_twice = (event == PENDING) & (previous_event == HANDOFF)
+    talk[talked_twice] = (time - time[previous[previous]])[talked_twice]
+
+    call_stats = new_call_stats()
+    # per state totals
+    for name, values, counted in [("total talk", talk, closes_talk | talked_twice),
+                                  ("total pending", pending, closes_pending)]:
+        totals = _sequential_sum(state[counted], values[counted], STATES.__len__())
+        for code in range(2, STATES.__len__()):
+            call_stats[STATES[code]][name] = totals[code]
+    for result, code in [("success", SUCCESS), ("failed", FAILED),
+                         ("handoff", HANDOFF)]:
+        counts = numpy.bincount(state[event == code], minlength=STATES.__len__())
+        for state_code in range(2, STATES.__len__()):
+            call_stats[STATES[state_code]][result] = int(counts[state_code])
+
+    # per call totals, for the calls that are over
+    call_talk = numpy.bincount(id, weights=talk)
+    call_pending = numpy.bincount(id, weights=pending)
+    for result, code in [("success", SUCCESS), ("failed", FAILED)]:
+        over = id[event == code]
+        call_stats[result]["count"] = over.__len__()
+        for name, totals in [("total talk", call_talk),
+                             ("total pending", call_pending)]:
+            call_stats[result][name] = _sequential_sum(
+                numpy.zeros(over.__len__(), numpy.int64), totals[over], 1)[0]
+    return summarize_calls(call_stats)
@@ -7,20 +7,31 @@ author: Geiger&Geiger
 created: 29/08/16
 """
 
+from heapq import heappush, heappop, heapify
 from config import *
 
+
 class EventQueue:
     def __init__(self, end_time=END_TIME):
         self.end_time = end_time
         self.simulation_time = 0
-        # the schedule is a dictionary (python equivalent of hash table)
-        # with key=time, and value=event
-        self.schedule = {}
-        # for sorting reasons, we also hold time list
-        # it's not memory efficient, but it helps readability
-        self.timetable = []
+        # the heap holds entries of the form (time, sequence, handle).
+        # the sequence number breaks ties between events scheduled
+        # for the same time, so they're popped in FIFO order
+        self.heap = []
+        self.sequence = 0
+        # a cancelled entry isn't removed from the heap, its handle
+        # is emptied and the entry is skipped when popped
+        self.size = 0
+        # events that were dispatched, for reuse
+        self.event_pool = []
 
     def push(self, time, event):
+        """
+        :return: a handle that can cancel the event,
+                 or False if the event is out of scope
+        :rtype: EventHandle
+        """
         # we shouldn't trust our caller to know what time it is,
         # so we add it ourselves.
         time += self.simulation_time
@@ -28,48 +39,155 @@ class EventQueue:
         if time > self.end_time:
             return False
 
-        # check if we need to initialize the schedule entry
-        if self.schedule.has_key(time):
-            self.schedule[time].append(event)
-        else:
-            self.schedule[time] = [event]
-        self.timetable.append(time)
-        self.timetable.sort()
-        return True
+        handle = EventHandle(self, time, event)
+        heappush(self.heap, (time, self.sequence, handle))
+        self.sequence += 1
+        self.size += 1
+        return handle
 
     def pop(self):
         # if we've reached the end, let it be known
-        if (self.simulation_time >= self.end_time
-            or self.timetable.__len__() == 0):
+        if self.simulation_time >= self.end_time or self.size == 0:
             raise IndexError
 
+        # skip the entries of cancelled events
+        time, sequence, handle = heappop(self.heap)
+        while handle.event is None:
+            time, sequence, handle = heappop(self.heap)
+        event = handle.event
+        handle.event = None
+        self.size -= 1
         # we need to advance the clock
-        self.simulation_time = self.timetable.pop(0)
-        event = self.schedule[self.simulation_time].pop(0)
-        # clean the schedule if there're no events
-        if self.schedule[self.simulation_time].__len__() == 0:
-            self.schedule.pop(self.simulation_time)
+        self.simulation_time = time
         return event
 
+    def dispatch(self, until=None, dispatcher=None, recycle=False):
+        """
+        pop the events in order and run their subjects, like pop does
+        one at a time. all the entries due at the same time are taken
+        off the heap in one batch, and the loop ends on the size of
+        the queue rather than on an exception
+        :param until: stop once the next event is after until
+        :param dispatcher: called with every event instead of running
+                           its subject, e.g. to time it
+        :param recycle: return every event that ran to the pool, for
+                        callers whose events all come from new_event
+        :return: whether the queue is over, False if it stopped at until
+        """
+        heap = self.heap
+        if until is None:
+            until = float("inf")
+        while self.size:
+            time = heap[0][0]
+            if time > until and until < self.end_time:
+                self.simulation_time = max(until, self.simulation_time)
+                return False
+            batch = [heappop(heap)]
+            while heap and heap[0][0] == time:
+                batch.append(heappop(heap))
+            if self._dispatch_batch(batch, dispatcher, recycle):
+                return True
+        return True
+
+    def _dispatch_batch(self, batch, dispatcher, recycle):
+        """
+        run the entries due at the same time, in order
+        :return: whether the queue is over
+        """
+        for i, (time, sequence, handle) in enumerate(batch):
+            event = handle.event
+            # it was cancelled, maybe by an event of this batch
+            if event is None:
+                continue
+            if self.simulation_time >= self.end_time:
+                # the end came in the middle of the batch
+                for entry in batch[i:]:
+                    heappush(self.heap, entry)
+                return True
+            handle.event = None
+            self.size -= 1
+            self.simulation_time = time
+            if dispatcher is None:
+                event.subject()
+            else:
+                dispatcher(event)
+            if recycle:
+                self.recycle(event)
+        return False
+
+    def __len__(self):
+        """
+        :return: the number of events pending, cancelled ones excluded
+        """
+        return self.size
+
     def get_time(self):
         return self.simulation_time
 
-    def cancel_event(self, time, event):
-        if self.schedule.has_key(time):
-            assert (isinstance(self.schedule[time], list))
-            try:
-                self.schedule[time].remove(event)
-                if self.schedule[time].__len__() == 0:
-                    self.schedule.pop(time)
-            except ValueError:
-                return False
-            self.timetable.remove(time)
-            return True
-        else:
-            raise ValueError("time %s does not exist in schedule" % str(time))
+    def cancel_event(self, handle):
+        return handle.cancel()
+
+    def new_event(self, object, subject):
+        """
+        :return: an Event, recycled from the pool if there's one
+        """
+        if self.event_pool:
+            event = self.event_pool.pop()
+            event.object = object
+            event.subject = subject
+            return event
+        return Event(object, subject)
+
+    def recycle(self, event):
+        """
+        return an event that was dispatched to the pool.
+        the event mustn't be used, or scheduled, anywhere else
+        """
+        event.object = None
+        event.subject = None
+        self.event_pool.append(event)
+
+    def _cancelled(self):
+        self.size -= 1
+        # don't let cancelled entries pile up in the heap
+        if self.heap.__len__() > 2 * self.size + 64:
+            # in place, dispatch holds on to the heap
+            self.heap[:] = [entry for entry in self.heap
+                            if entry[-1].event is not None]
+            heapify(self.heap)
 
 
-class Event:
+class EventHandle(object):
+    __slots__ = ("queue", "time", "event")
+
+    def __init__(self, queue, time, event):
+        """
+        returned by EventQueue.push, for cancelling the scheduled event
+        :param queue: the queue the event was pushed to
+        :param time: absolute time the event is scheduled for
+        :param event: the scheduled event, None once popped or cancelled
+        :type queue: EventQueue
+        :type time: float
+        :type event: Event
+        """
+        self.queue = queue
+        self.time = time
+        self.event = event
+
+    def cancel(self):
+        """
+        :return: whether the event was still pending
+        """
+        if self.event is None:
+            return False
+        self.event = None
+        self.queue._cancelled()
+        return True
+
+
+class Event(object):
+    __slots__ = ("object", "subject")
+
     def __init__(self, object, subject):
         """
         :param object: instance, whom the event happens to
@@ -88,14 +206,14 @@ if __name__ == "__main__":
     event_q = EventQueue(100)
     event_q.push(50, Event(5, 6))
     to_be_cancelled = Event(3, 4)
-    event_q.push(40, to_be_cancelled)
-    event_q.push(50, to_be_cancelled)
+    first = event_q.push(40, to_be_cancelled)
+    second = event_q.push(50, to_be_cancelled)
     event_q.push(60, to_be_cancelled)
     event_q.push(50, Event(1, 2))
     event_q.push(20, Event(7, 8))
     print str(event_q.pop())
-    event_q.cancel_event(40, to_be_cancelled)
-    event_q.cancel_event(50, to_be_cancelled)
+    first.cancel()
+    event_q.cancel_event(second)
     print str(event_q.pop())
     print str(event_q.pop())
     print str(event_q.pop())
@@ -107,3 +225,55 @@ if __name__ == "__main__":
     Event: object 1, subject2
     Event: object 3, subject4
     """
+
+    # dispatch must run the events in the order pop does, with ties and
+    # events that schedule and cancel others as they happen
+    from random import Random
+
+    def happenings(step=None):
+        """
+        :param step: dispatch in windows of step, None to pop the events
+        :return: the time and number of every event, in the order they ran
+        """
+        rand = Random(1)
+        event_q = EventQueue(100)
+        order = []
+        handles = []
+
+        def schedule():
+            number = handles.__len__()
+            handles.append(event_q.push(rand.randint(0, 5), event_q.new_event(
+                number, lambda: happen(number))))
+
+        def happen(number):
+            order.append((event_q.get_time(), number))
+            for _ in range(rand.randint(0, 2)):
+                schedule()
+            if rand.random() < 0.3:
+                handle = rand.choice(handles)
+                if handle:
+                    handle.cancel()
+
+        for _ in range(200):
+            schedule()
+        if step is None:
+            while True:
+                try:
+                    event = event_q.pop()
+                except IndexError:
+                    break
+                event.subject()
+        else:
+            until = 0
+            while not event_q.dispatch(until):
+                until += step
+        return order
+
+    popped = happenings()
+    print popped.__len__() > 1000, popped == happenings(float("inf")), \
+        popped == happenings(7)
+
+    """
+    expected output:
+    True True True
+    """
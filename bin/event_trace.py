@@ -0,0 +1,142 @@
+#! /usr/bin/python
+
+"""
+this module writes the log of the simulation to a binary trace file
+while it runs, and analyzes trace files of archived runs.
+the file is a header followed by fixed size records, so it can be
+memory-mapped back as a NumPy structured array
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import os
+import sys
+import numpy
+from cellnet_statistics import report
+from event_log import entity_kind, channel_statistics, call_statistics
+
+MAGIC = "CNTRACE2"
+# the header is the magic, the shape of the network, and the end
+# time of the run, which is NaN until the trace is closed
+HEADER = numpy.dtype([("magic", "S8"), ("cells", "<i4"), ("channels", "<i4"),
+                      ("end time", "<f8")])
+RECORD = numpy.dtype([
+    ("time", "<f8"),
+    ("kind", "u1"),
+    ("id", "<i8"),
+    ("event", "u1"),
+    ("state", "u1"),
+])
+
+
+class TraceWriter:
+    def __init__(self, path, cells=7, channels=10, block=2**16):
+        """
+        :param path: where to write the trace
+        :param cells: number of cells in the network
+        :param channels: number of channels in every cell
+        :param block: number of records to buffer between writes
+        """
+        self.path = path
+        self.cells = cells
+        self.channels = channels
+        self.file = open(path, "wb")
+        self._write_header(float("nan"))
+        self.buffer = numpy.empty(block, RECORD)
+        self.size = 0
+
+    def record(self, time, entity, event):
+        self.buffer[self.size] = (time, entity_kind(event), entity.id,
+                                  event, entity.state)
+        self.size += 1
+        if self.size == self.buffer.__len__():
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.size].tofile(self.file)
+        self.size = 0
+
+    def close(self, end_time):
+        self.flush()
+        self._write_header(end_time)
+        self.file.close()
+
+    def __getstate__(self):
+        # a checkpoint keeps how far the trace got, not the file
+        self.flush()
+        self.file.flush()
+        state = self.__dict__.copy()
+        state["file"] = None
+        state["position"] = self.file.tell()
+        return state
+
+    def resume(self, path):
+        """
+        go on with a restored trace in a file of its own: it starts with
+        the records of the original trace up to the checkpoint, and the
+        original trace is only read, so branches don't overwrite it
+        :param path: where to write the trace of the restored run
+        """
+        if os.path.realpath(path) == os.path.realpath(self.path):
+            raise ValueError("a restored run can't write over the trace "
+                             "it was checkpointed from")
+        copied = 0
+        with open(self.path, "rb") as original:
+            self.file = open(path, "wb")
+            while copied < self.position:
+                chunk = original.read(min(2**20, self.position - copied))
+                if not chunk:
+                    raise ValueError("trace %s is shorter than the checkpoint"
+                                     % self.path)
+                self.file.write(chunk)
+                copied += chunk.__len__()
+        self.path = path
+        del self.position
+        # the copy may come from a closed trace, this one isn't closed yet
+        self._write_header(float("nan"))
+
+    def _write_header(self, end_time):
+        self.file.seek(0)
+        numpy.array([(MAGIC, self.cells, self.channels, end_time)],
+                    HEADER).tofile(self.file)
+        self.file.seek(0, 2)
+
+
+def read_trace(path):
+    """
+    :return: the records of the trace, memory-mapped, and its header
+    """
+    header = numpy.fromfile(path, HEADER, count=1)
+    if header.__len__() == 0 or header["magic"][0] != MAGIC:
+        raise ValueError("%s is not a trace file" % path)
+    end_time = header["end time"][0]
+    if numpy.isnan(end_time):
+        raise ValueError("trace %s wasn't closed" % path)
+    try:
+        records = numpy.memmap(path, RECORD, mode="r", offset=HEADER.itemsize)
+    except ValueError:
+        # numpy can't map an empty body
+        records = numpy.empty(0, RECORD)
+    return records, header[0]
+
+
+def trace_statistics(path):
+    """
+    :return: the channel stats and the call stats of a trace file
+    """
+    records, header = read_trace(path)
+    channel_stats = channel_statistics(records["time"], records["kind"],
+                                       records["id"], records["state"],
+                                       float(header["end time"]),
+                                       int(header["cells"]),
+                                       int(header["channels"]))
+    call_stats = call_statistics(records["time"], records["kind"],
+                                 records["id"], records["event"],
+                                 records["state"])
+    return channel_stats, call_stats
+
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        channel_stats, call_stats = trace_statistics(path)
+        report(channel_stats, call_stats)
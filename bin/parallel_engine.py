@@ -0,0 +1,272 @@
+#! /usr/bin/python
+
+"""
+this module runs a single simulation of a large network on several
+processes. the cells are split into regions, and every region is a
+simulation of its own, in its own process. a call handed off to a
+cell of another region is sent there as a message.
+the regions advance in time windows as long as the shortest talk
+(MIN_TALK): a call decides whether and where it's handed off once it
+starts talking, so every handoff is known a window ahead, and no
+region ever receives a message from its past
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import argparse
+from multiprocessing import Pipe, Process
+from random import Random
+from traceback import format_exc
+from cellnet_entities import Call
+from cellnet_simulation import CellnetSimulation
+from cellnet_statistics import PROD_METRICS, ratio
+from config import Parameters
+from topology import build_topology
+from variates import MIN_TALK
+
+
+class RegionError(Exception):
+    """
+    a region failed, or its process is gone
+    """
+
+
+def partition(cells, regions):
+    """
+    split the cells into regions of consecutive ids, which are rows
+    of a hex grid, so most neighbours share a region
+    :return: the region of every cell
+    """
+    if not 0 < regions <= cells:
+        raise ValueError("can't split %d cells into %d regions"
+                         % (cells, regions))
+    return [cell * regions // cells for cell in range(cells)]
+
+
+class RegionCall(Call):
+    __slots__ = ("next_cell",)
+
+    def start(self):
+        self.next_cell = None
+        Call.start(self)
+
+    def request_channel(self):
+        if self.next_cell is None:
+            # new calls arrive in the cells of the region
+            self.cell = self.simulation.random.choice(
+                self.simulation.local_cells)
+        else:
+            self.cell = self.next_cell
+            self.next_cell = None
+        channel = self.cell.pick_channel(self)
+        if channel is None:
+            self.simulation.log(self, self.simulation.PENDING)
+            return False
+        return self.receive_channel(channel)
+
+    def receive_channel(self, channel):
+        simulation = self.simulation
+        self.channel = channel
+        simulation.log(self, simulation.TALK)
+        transition_time = simulation.variates.talk.next()
+        event_q = simulation.event_q
+        if not event_q.push(transition_time,
+                            event_q.new_event(self, self.transition)):
+            return
+        # the handoff is decided now, a talk ahead
+        if simulation.variates.handoff.next():
+            self.next_cell = simulation.pick_neighbour(self.cell)
+            if not simulation.is_local(self.next_cell):
+                simulation.send(event_q.get_time() + transition_time, self)
+
+    def transition(self):
+        self.channel.evaq()
+        if self.next_cell is None:
+            self.simulation.log(self, self.simulation.SUCCESS)
+            self.finish()
+            return
+        self.simulation.log(self, self.simulation.HANDOFF)
+        self.state = Call.HANDOFF
+        if self.simulation.is_local(self.next_cell):
+            self.request_channel()
+        else:
+            # it goes on in the other region, which was told already
+            self.simulation.stats.forget(self.id)
+            self.next_cell = None
+            self.finish()
+
+
+class RegionSimulation(CellnetSimulation):
+    def __init__(self, parameters, seed, region, regions):
+        """
+        the cells of one region, and the calls that arrive to them
+        :param region: the region of this simulation
+        :param regions: the region of every cell, see partition
+        """
+        params = Parameters(**(parameters or {}))
+        local = regions.count(region)
+        # the arrivals of the network, thinned to the share of the region
+        parameters = dict(parameters or {})
+        parameters["ARRIVE_SCALE"] = \
+            float(params.ARRIVE_SCALE) * regions.__len__() / local
+        CellnetSimulation.__init__(self, parameters, seed=seed)
+        self.region = region
+        self.regions = regions
+        self.region_count = max(regions) + 1
+        self.local_cells = [cell for cell in self.network.cells
+                            if regions[cell.id] == region]
+        self.generator.call_class = RegionCall
+        # the handoffs to other regions: (time, call id, cell id)
+        self.outbox = []
+
+    def new_call_id(self):
+        # every region numbers its calls apart from the others
+        self.calls += 1
+        return (self.calls - 1) * self.region_count + self.region
+
+    def is_local(self, cell):
+        return self.regions[cell.id] == self.region
+
+    def pick_neighbour(self, cell):
+        network = self.network
+        if network.neighbours is not None:
+            return self.random.choice(network.neighbours[cell.id])
+        return self.random.choice(network.cells)
+
+    def send(self, time, call):
+        self.outbox.append((time, call.id, call.next_cell.id))
+
+    def receive(self, time, callid, cellid):
+        """
+        schedule a call handed off from another region
+        """
+        if self.call_pool:
+            call = self.call_pool.pop()
+        else:
+            call = RegionCall.__new__(RegionCall)
+            call.simulation = self
+        call.id = callid
+        call.state = Call.HANDOFF
+        call.channel = None
+        call.hangup = None
+        call.next_cell = self.network.cells[cellid]
+        event_q = self.event_q
+        event_q.push(time - event_q.get_time(),
+                     event_q.new_event(call, call.request_channel))
+
+
+def _region(connection, parameters, seed, region, regions):
+    """
+    a region process: run window after window, as the parent asks.
+    if it fails, the error is sent instead of the answer
+    """
+    try:
+        simulation = RegionSimulation(parameters, seed, region, regions)
+        for until, handoffs in iter(connection.recv, None):
+            for handoff in handoffs:
+                simulation.receive(*handoff)
+            simulation.run(until)
+            connection.send(simulation.outbox)
+            simulation.outbox = []
+        connection.send(simulation.stats.totals(simulation.params.END_TIME))
+    except Exception:
+        connection.send(RegionError("region %d failed:\n%s"
+                                    % (region, format_exc())))
+    connection.close()
+
+
+def _receive(connection, region):
+    """
+    :return: the answer of a region, raising its failure
+    """
+    try:
+        message = connection.recv()
+    except EOFError:
+        raise RegionError("region %d exited" % region)
+    if isinstance(message, RegionError):
+        raise message
+    return message
+
+
+def run_partitioned(parameters=None, seed=None, regions=2):
+    """
+    run one simulation, split into regions on their own processes
+    :param parameters: the model parameters to override (see config)
+    :param regions: number of regions, and of processes
+    :return: its overall statistics, as listed in PROD_METRICS
+    """
+    params = Parameters(**(parameters or {}))
+    if params.ARRIVAL_PROFILE is not None:
+        raise ValueError("the regions only run constant arrival rates")
+    cells = build_topology(params.TOPOLOGY).cells
+    region_of = partition(cells, regions)
+    rand = Random(seed)
+    connections = []
+    processes = []
+    for region in range(regions):
+        parent, child = Pipe()
+        region_seed = None if seed is None else rand.getrandbits(32)
+        process = Process(target=_region, args=(child, parameters,
+                                                region_seed, region,
+                                                region_of))
+        process.daemon = True
+        process.start()
+        # only the region holds its end, so it's closed if the region dies
+        child.close()
+        connections.append(parent)
+        processes.append(process)
+
+    try:
+        inboxes = [[] for _ in range(regions)]
+        window = 0
+        while window < params.END_TIME:
+            window = min(window + MIN_TALK, params.END_TIME)
+            for connection, inbox in zip(connections, inboxes):
+                connection.send((window, inbox))
+            inboxes = [[] for _ in range(regions)]
+            for region, connection in enumerate(connections):
+                for handoff in _receive(connection, region):
+                    inboxes[region_of[handoff[2]]].append(handoff)
+        totals = []
+        for region, connection in enumerate(connections):
+            connection.send(None)
+            totals.append(_receive(connection, region))
+    except BaseException:
+        # the other regions would wait for their next window forever
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+
+    metrics = []
+    for i, metric in enumerate(PROD_METRICS):
+        numerator = sum(region[i][0] for region in totals)
+        denominator = sum(region[i][1] for region in totals)
+        if metric == "channel_utilization":
+            # every region counts the channels of the whole network
+            denominator = cells * params.CHANNELS * params.END_TIME
+        metrics.append(ratio(numerator, denominator))
+    return tuple(metrics)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="run one simulation on several processes")
+    parser.add_argument("-r", "--regions", type=int, default=2)
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    parser.add_argument("-t", "--topology", default=None,
+                        help="see TOPOLOGY")
+    parser.add_argument("--arrive-scale", type=float, default=None,
+                        help="see ARRIVE_SCALE")
+    args = parser.parse_args()
+
+    parameters = {}
+    if args.topology is not None:
+        parameters["TOPOLOGY"] = args.topology
+    if args.arrive_scale is not None:
+        parameters["ARRIVE_SCALE"] = args.arrive_scale
+    print ",".join(PROD_METRICS)
+    print ",".join(str(metric) for metric in
+                   run_partitioned(parameters, args.seed, args.regions))
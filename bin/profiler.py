@@ -0,0 +1,161 @@
+#! /usr/bin/python
+
+"""
+this module instruments the event loop: where the time of a run goes,
+per kind of event, and how the run progresses over simulated time
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import cProfile
+import csv
+import json
+from timeit import default_timer
+
+SAMPLE_COLUMNS = ["time", "wall", "queue_depth", "events",
+                  "events_per_second", "wall_per_hour"]
+
+
+class Profiler:
+    def __init__(self, simulation, sample_interval=60*60,
+                 profile_window=None):
+        """
+        attached to a simulation, it's handed every event to dispatch.
+        a simulation without a profiler dispatches on its own
+        :param sample_interval: simulated seconds between samples
+                                of the progress of the run
+        :param profile_window: (start, end) simulated times to run
+                               cProfile between, or None
+        """
+        self.simulation = simulation
+        self.sample_interval = sample_interval
+        # subject name -> [dispatches, wall seconds]
+        self.subjects = {}
+        # rows of the form SAMPLE_COLUMNS
+        self.samples = []
+        self.next_sample = sample_interval
+        self.events = 0
+        self.last_wall = None
+        self.profile_window = profile_window
+        self.profile = None
+        if profile_window is not None:
+            self.profile = cProfile.Profile()
+        self._profiling = False
+
+    def __getstate__(self):
+        # cProfile can't be pickled, so a checkpoint loses the capture
+        state = self.__dict__.copy()
+        state["profile"] = None
+        state["_profiling"] = False
+        return state
+
+    def dispatch(self, event):
+        """
+        run the subject of the event, timing it
+        """
+        time = self.simulation.event_q.get_time()
+        if self.last_wall is None:
+            self.last_wall = default_timer()
+        while time >= self.next_sample:
+            self.sample(self.next_sample)
+        if self.profile is not None:
+            self._window(time)
+
+        name = event.subject.__name__
+        start = default_timer()
+        event.subject()
+        elapsed = default_timer() - start
+        if name in self.subjects:
+            subject = self.subjects[name]
+            subject[0] += 1
+            subject[1] += elapsed
+        else:
+            self.subjects[name] = [1, elapsed]
+        self.events += 1
+
+    def _window(self, time):
+        start, end = self.profile_window
+        if not self._profiling and start <= time < end:
+            self.profile.enable()
+            self._profiling = True
+        elif self._profiling and time >= end:
+            self.profile.disable()
+            self._profiling = False
+
+    def sample(self, time):
+        """
+        record the progress of the run since the last sample
+        """
+        wall = default_timer()
+        interval = time - (self.next_sample - self.sample_interval)
+        self.samples.append([
+            time,
+            wall - self.last_wall,
+            self.simulation.event_q.__len__(),
+            self.events,
+            self.events / float(interval),
+            (wall - self.last_wall) * 60 * 60 / interval])
+        self.last_wall = wall
+        self.events = 0
+        self.next_sample += self.sample_interval
+
+    def finish(self):
+        """
+        called at the end of the run, to close the last sample
+        """
+        if self._profiling:
+            self.profile.disable()
+            self._profiling = False
+        time = self.simulation.event_q.get_time()
+        if self.last_wall is not None and \
+                time > self.next_sample - self.sample_interval:
+            self.sample(time)
+
+    def dispatch_statistics(self):
+        """
+        :return: per subject, the dispatches, the total wall seconds
+                 and the mean microseconds per dispatch
+        """
+        return dict(
+            (name, {"count": count, "seconds": seconds,
+                    "mean_us": seconds * 10**6 / count})
+            for name, (count, seconds) in self.subjects.iteritems())
+
+    def to_json(self, path):
+        with open(path, "w") as json_file:
+            json.dump({"dispatch": self.dispatch_statistics(),
+                       "samples": [dict(zip(SAMPLE_COLUMNS, sample))
+                                   for sample in self.samples]},
+                      json_file, indent=2, sort_keys=True)
+
+    def to_csv(self, path):
+        """
+        write the samples to path, and the dispatch statistics
+        next to it, with a .dispatch.csv extension
+        """
+        with open(path, "wb") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(SAMPLE_COLUMNS)
+            writer.writerows(self.samples)
+        with open(path.rsplit(".", 1)[0] + ".dispatch.csv", "wb") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["subject", "count", "seconds", "mean_us"])
+            for name, stats in sorted(self.dispatch_statistics().iteritems()):
+                writer.writerow([name, stats["count"], stats["seconds"],
+                                 stats["mean_us"]])
+
+    def export(self, path):
+        """
+        write everything out, as JSON or CSV by the extension of path
+        """
+        if path.endswith(".json"):
+            self.to_json(path)
+        else:
+            self.to_csv(path)
+
+    def print_profile(self, sort="cumulative", limit=20):
+        """
+        print the cProfile capture of the profile window
+        """
+        import pstats
+        pstats.Stats(self.profile).sort_stats(sort).print_stats(limit)
@@ -0,0 +1,146 @@
+#! /usr/bin/python
+
+"""
+this module runs many independent replications of the simulation
+on a process pool, and summarizes them with confidence intervals.
+the replications run on CellnetSimulation ("objects"), or in batches
+on BatchSimulation ("batch"), which only runs the plain network
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import argparse
+from math import sqrt
+from multiprocessing import Pool
+from random import Random
+from cellnet_simulation import CellnetSimulation
+from cellnet_statistics import PROD_METRICS
+from convergence import t_quantile
+
+ENGINES = ["objects", "batch"]
+
+
+def replicate(seed, parameters=None):
+    """
+    run a single replication
+    :param parameters: the model parameters to override (see config)
+    :return: its overall statistics, as listed in PROD_METRICS
+    """
+    simulation = CellnetSimulation(parameters, seed=seed)
+    simulation.run()
+    return simulation.prod_metrics()
+
+
+def _replicate(task):
+    # pool.map passes a single argument
+    seed, parameters = task
+    return replicate(seed, parameters)
+
+
+def replicate_batch(replications, seed, parameters=None):
+    """
+    run replications together, see BatchSimulation
+    :return: the overall statistics of every replication
+    """
+    # numpy is only loaded by the workers of the batch engine
+    from batch_engine import BatchSimulation
+    simulation = BatchSimulation(replications, parameters, seed)
+    simulation.run()
+    return simulation.prod_metrics()
+
+
+def _replicate_batch(task):
+    replications, seed, parameters = task
+    return replicate_batch(replications, seed, parameters)
+
+
+def replica_seeds(replications, seed=0):
+    """
+    :return: a seed for every replication, derived from the given seed,
+             so the same seed always yields the same replications
+    """
+    rand = Random(seed)
+    return [rand.getrandbits(32) for _ in xrange(replications)]
+
+
+def run_replications(replications, seed=0, processes=None,
+                     parameters=None, engine="objects", batch=1000):
+    """
+    :param processes: size of the pool, defaults to the number of cores
+    :param parameters: the model parameters to override (see config)
+    :param engine: one of ENGINES
+    :param batch: most replications to run together, with "batch"
+    :return: the overall statistics of every replication, in seed order
+    """
+    if engine == "batch":
+        sizes = [batch] * (replications / batch)
+        if replications % batch:
+            sizes.append(replications % batch)
+        tasks = [(size, batch_seed, parameters) for size, batch_seed
+                 in zip(sizes, replica_seeds(sizes.__len__(), seed))]
+        pool = Pool(processes)
+        try:
+            return [metrics for results
+                    in pool.map(_replicate_batch, tasks, chunksize=1)
+                    for metrics in results]
+        finally:
+            pool.close()
+            pool.join()
+    elif engine != "objects":
+        raise ValueError("unknown engine " + engine)
+    return run_tasks([(replica_seed, parameters) for replica_seed
+                      in replica_seeds(replications, seed)], processes)
+
+
+def run_tasks(tasks, processes=None):
+    """
+    :param tasks: (seed, parameters) of the replications to run
+    :return: the overall statistics of every replication, in task order
+    """
+    pool = Pool(processes)
+    try:
+        return pool.map(_replicate, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def summarize(results, confidence=0.95):
+    """
+    :param results: the overall statistics of the replications
+    :return: for every metric in PROD_METRICS, its mean and the
+             half width of its confidence interval
+    """
+    n = results.__len__()
+    quantile = t_quantile((1 + confidence) / 2.0, n - 1) if n > 1 else 0
+    summary = []
+    for values in zip(*results):
+        mean = sum(values) / n
+        if n > 1:
+            std = sqrt(sum((value - mean) ** 2 for value in values) / (n - 1))
+        else:
+            std = float("nan")
+        summary.append((mean, quantile * std / sqrt(n)))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="run independent replications of the simulation")
+    parser.add_argument("-n", "--replications", type=int, default=10)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="defaults to the number of cores")
+    parser.add_argument("-c", "--confidence", type=float, default=0.95)
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="objects")
+    parser.add_argument("-b", "--batch", type=int, default=1000,
+                        help="most replications to run together, "
+                             "with --engine batch")
+    args = parser.parse_args()
+
+    results = run_replications(args.replications, args.seed, args.processes,
+                               engine=args.engine, batch=args.batch)
+    print "metric,mean,half_width"
+    for metric, (mean, half_width) in \
+            zip(PROD_METRICS, summarize(results, args.confidence)):
+        print metric + "," + str(mean) + "," + str(half_width)
@@ -0,0 +1,351 @@
+#! /usr/bin/python
+
+"""
+this module serves simulations to local clients over a unix socket.
+clients submit parameter sets, the runs are scheduled on a pool of
+worker processes, and every run reports its metrics as it goes, so
+clients can watch it converge and cancel it early.
+the protocol is a JSON object per line, each way:
+    {"op": "submit", "parameters": {...}, "seed": 1, "interval": 3600}
+        -> {"job": 0}
+    {"op": "watch", "job": 0}
+        -> an update per interval, up to the last one. the connection
+           answers nothing else meanwhile
+    {"op": "cancel", "job": 0} -> {"job": 0, "cancelled": true}
+    {"op": "status"} -> {"jobs": {"0": last update, ...}}
+a bad request is answered with {"error": "..."}, and the interval must
+be a positive number of simulated seconds.
+an update is {"job", "state", "time", "events", "metrics"}, where state
+is "queued", "running", "done", "cancelled" or "failed", and metrics
+are the current estimates of PROD_METRICS (null for the ones with
+nothing to estimate them from yet). a failed update adds "error", and
+has no metrics. a job that's over keeps only its last update
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import argparse
+import json
+import os
+import socket
+import SocketServer
+import threading
+from multiprocessing import Manager, Process, Queue, cpu_count
+from cellnet_simulation import CellnetSimulation
+
+FINAL_STATES = ["done", "cancelled", "failed"]
+
+
+def _work(tasks, updates, cancelled):
+    """
+    a worker process: run the tasks, and report every interval
+    """
+    for job, parameters, seed, interval in iter(tasks.get, None):
+        simulation = None
+        try:
+            simulation = CellnetSimulation(parameters, seed=seed)
+            until, over = 0, False
+            while not over:
+                if job in cancelled:
+                    updates.put(_update(job, "cancelled", simulation))
+                    break
+                until += interval
+                over = simulation.run(until)
+                updates.put(_update(job, "done" if over else "running",
+                                    simulation))
+        except Exception as error:
+            update = _update(job, "failed", simulation, metrics=False)
+            # str of a KeyError is the repr of its key
+            update["error"] = unicode(error.args[0]) if error.args \
+                else error.__class__.__name__
+            updates.put(update)
+
+
+def _update(job, state, simulation=None, metrics=True):
+    """
+    :param simulation: the simulation of the job, None before it's built
+    :param metrics: whether to estimate the metrics, which a simulation
+                    that failed may not be able to
+    """
+    update = {"job": job, "state": state, "time": 0, "events": 0,
+              "metrics": None}
+    if simulation is not None:
+        event_q = simulation.event_q
+        update["time"] = event_q.get_time()
+        # every event pushed was dispatched or cancelled, or still waits
+        update["events"] = event_q.sequence - event_q.__len__()
+        if metrics:
+            # a metric with nothing to estimate it from yet is nan,
+            # which JSON can't carry
+            update["metrics"] = [None if metric != metric else metric
+                                 for metric in simulation.prod_metrics()]
+    return update
+
+
+class SimulationService(SocketServer.ThreadingMixIn,
+                        SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, processes=None):
+        """
+        :param path: the unix socket to listen on
+        :param processes: number of workers, defaults to the number
+                          of cores
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        self.manager = Manager()
+        self.cancelled = self.manager.dict()
+        self.tasks = Queue()
+        self.updates = Queue()
+        self.workers = [Process(target=_work, args=(self.tasks, self.updates,
+                                                    self.cancelled))
+                        for _ in range(processes or cpu_count())]
+        for worker in self.workers:
+            worker.daemon = True
+            worker.start()
+        # the updates of every job, guarded by changed. a job that's
+        # over keeps only its last one. counts are the updates so far
+        self.jobs = {}
+        self.counts = {}
+        self.changed = threading.Condition()
+        self.collector = threading.Thread(target=self._collect)
+        self.collector.daemon = True
+        self.collector.start()
+
+    def _collect(self):
+        for update in iter(self.updates.get, None):
+            job = update["job"]
+            with self.changed:
+                self.counts[job] += 1
+                if update["state"] in FINAL_STATES:
+                    self.jobs[job] = [update]
+                    self.cancelled.pop(job, None)
+                else:
+                    self.jobs[job].append(update)
+                self.changed.notify_all()
+
+    def submit(self, parameters=None, seed=None, interval=60*60):
+        """
+        :param interval: simulated seconds between updates
+        :return: the id of the new job
+        """
+        if isinstance(interval, bool) \
+                or not isinstance(interval, (int, long, float)) \
+                or not interval > 0:
+            raise ValueError("interval must be a positive number of seconds")
+        with self.changed:
+            job = self.jobs.__len__()
+            self.jobs[job] = [_update(job, "queued")]
+            self.counts[job] = 1
+        self.tasks.put((job, parameters, seed, interval))
+        return job
+
+    def cancel(self, job):
+        """
+        :return: whether the job was still going
+        """
+        with self.changed:
+            if self.jobs[job][-1]["state"] in FINAL_STATES:
+                return False
+            # under the lock, so a job that's over is never marked
+            self.cancelled[job] = True
+        return True
+
+    def watch(self, job):
+        """
+        :return: a generator of the updates of the job, from its first
+                 to its last, blocking for the ones to come. once the
+                 job is over, only its last update is left to see
+        """
+        seen = 0
+        while True:
+            with self.changed:
+                while self.counts[job] == seen:
+                    self.changed.wait()
+                updates = self.jobs[job][seen - self.counts[job]:]
+                seen = self.counts[job]
+            for update in updates:
+                yield update
+            if updates[-1]["state"] in FINAL_STATES:
+                return
+
+    def status(self):
+        with self.changed:
+            return dict((job, updates[-1])
+                        for job, updates in self.jobs.iteritems())
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        os.remove(self.server_address)
+        # the stop markers come after the queued jobs, which end
+        # at once, and the running ones stop at their next update
+        with self.changed:
+            for job, updates in self.jobs.iteritems():
+                if updates[-1]["state"] not in FINAL_STATES:
+                    self.cancelled[job] = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.updates.put(None)
+        self.manager.shutdown()
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            for line in iter(self.rfile.readline, ""):
+                self._serve(line)
+        except socket.error:
+            # the client went away, maybe in the middle of a watch
+            pass
+
+    def _serve(self, line):
+        """
+        answer a line of the client, an error for a bad request
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as error:
+            self._send({"error": "malformed request: " + str(error)})
+            return
+        if not isinstance(request, dict):
+            self._send({"error": "a request is a JSON object"})
+            return
+        op = request.get("op")
+        job = request.get("job")
+        if op in ["watch", "cancel"] and \
+                (isinstance(job, bool) or not isinstance(job, (int, long))):
+            self._send({"error": "a job is an integer id"})
+            return
+        try:
+            if op == "submit":
+                job = self.server.submit(request.get("parameters"),
+                                         request.get("seed"),
+                                         request.get("interval", 60*60))
+                self._send({"job": job})
+            elif op == "watch":
+                for update in self.server.watch(job):
+                    self._send(update)
+            elif op == "cancel":
+                self._send({"job": job, "cancelled": self.server.cancel(job)})
+            elif op == "status":
+                self._send({"jobs": self.server.status()})
+            else:
+                self._send({"error": "unknown op " + str(op)})
+        except KeyError as error:
+            self._send({"error": "unknown job " + str(error)})
+        except ValueError as error:
+            self._send({"error": str(error)})
+
+    def finish(self):
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            # what was left to send has nowhere to go
+            pass
+
+    def _send(self, message):
+        self.wfile.write(json.dumps(message) + "\n")
+        self.wfile.flush()
+
+
+class Client:
+    def __init__(self, path):
+        """
+        talks to a SimulationService listening on path
+        """
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.file = self.socket.makefile("rwb")
+
+    def _request(self, **request):
+        self.file.write(json.dumps(request) + "\n")
+        self.file.flush()
+
+    def _response(self):
+        return json.loads(self.file.readline())
+
+    def _reply(self):
+        """
+        :return: the response to a request, raising the service's error
+        """
+        response = self._response()
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def submit(self, parameters=None, seed=None, interval=60*60):
+        self._request(op="submit", parameters=parameters, seed=seed,
+                      interval=interval)
+        return self._reply()["job"]
+
+    def watch(self, job):
+        """
+        the connection streams the updates until the last one,
+        cancel the job from another client
+        """
+        self._request(op="watch", job=job)
+        while True:
+            update = self._response()
+            yield update
+            if update["state"] in FINAL_STATES:
+                return
+
+    def cancel(self, job):
+        self._request(op="cancel", job=job)
+        return self._reply()["cancelled"]
+
+    def status(self):
+        self._request(op="status")
+        return self._reply()["jobs"]
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="serve simulations over a unix socket")
+    parser.add_argument("--socket", default="/tmp/cellnet.sock")
+    subparsers = parser.add_subparsers(dest="command")
+    serve = subparsers.add_parser("serve")
+    serve.add_argument("-p", "--processes", type=int, default=None,
+                       help="defaults to the number of cores")
+    submit = subparsers.add_parser("submit",
+                                   help="submit a run and watch it")
+    submit.add_argument("parameters", nargs="*", metavar="NAME=VALUE",
+                        help="a parameter to override, the value is JSON")
+    submit.add_argument("-s", "--seed", type=int, default=None)
+    submit.add_argument("-i", "--interval", type=float, default=60*60,
+                        help="simulated seconds between updates")
+    cancel = subparsers.add_parser("cancel")
+    cancel.add_argument("job", type=int)
+    subparsers.add_parser("status")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = SimulationService(args.socket, args.processes)
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.server_close()
+    else:
+        client = Client(args.socket)
+        if args.command == "submit":
+            parameters = dict((name, json.loads(value)) for name, value in
+                              (parameter.split("=", 1)
+                               for parameter in args.parameters))
+            job = client.submit(parameters, args.seed, args.interval)
+            for update in client.watch(job):
+                print json.dumps(update)
+        elif args.command == "cancel":
+            print client.cancel(args.job)
+        else:
+            print json.dumps(client.status(), indent=2, sort_keys=True)
+        client.close()
@@ -0,0 +1,174 @@
+#! /usr/bin/python
+
+"""
+this module sweeps the simulation over sets of parameters.
+the replications are fanned out to a process pool, and their
+results are cached on disk, so only new points are computed
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import argparse
+import json
+import os
+from hashlib import sha1
+from itertools import product
+from cellnet_statistics import PROD_METRICS
+from config import Parameters
+from runner import replica_seeds, run_tasks, summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(HERE, os.pardir, "sweep_cache")
+# the modules whose code determines the results of a replication
+MODEL_MODULES = [
+    "arrival_profile.py",
+    "cellnet_entities.py",
+    "cellnet_simulation.py",
+    "cellnet_statistics.py",
+    "config.py",
+    "event_queue.py",
+    "topology.py",
+    "variates.py",
+]
+
+
+def grid(**axes):
+    """
+    :param axes: for every parameter, the values it sweeps
+    :return: the parameter sets of the cartesian product of the axes
+    """
+    names = sorted(axes)
+    return [dict(zip(names, values))
+            for values in product(*[axes[name] for name in names])]
+
+
+def code_version():
+    digest = sha1()
+    for module in MODEL_MODULES:
+        with open(os.path.join(HERE, module), "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=CACHE_DIR, version=None):
+        """
+        :param directory: where the results are kept, a file per result
+        :param version: the code version, defaults to the current code
+        """
+        self.directory = directory
+        self.version = version if version is not None else code_version()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, parameters, seed):
+        key = json.dumps([parameters, seed, self.version], sort_keys=True)
+        return os.path.join(self.directory, sha1(key).hexdigest() + ".json")
+
+    def get(self, parameters, seed):
+        path = self._path(parameters, seed)
+        if not os.path.isfile(path):
+            return None
+        with open(path) as cached:
+            return tuple(json.load(cached)["metrics"])
+
+    def put(self, parameters, seed, metrics):
+        path = self._path(parameters, seed)
+        # write aside and rename, so a crash never leaves half a result
+        with open(path + ".tmp", "w") as cached:
+            json.dump({"parameters": parameters, "seed": seed,
+                       "version": self.version, "metrics": list(metrics)},
+                      cached)
+        os.rename(path + ".tmp", path)
+
+
+def run_sweep(points, replications=10, seed=0, processes=None,
+              cache=None, confidence=0.95, analytic=False):
+    """
+    :param points: the parameter sets to simulate (see grid)
+    :param cache: a ResultCache, or None to use the default one
+    :param analytic: add the analytic estimates of every point (see
+                     erlang), and whether the simulation agrees with them
+    :return: for every point, its parameters, the results of its
+             replications and their summary (see runner.summarize)
+    """
+    if cache is None:
+        cache = ResultCache()
+    if analytic:
+        # the estimates are computed with numpy, which the sweeps
+        # without them do without
+        from erlang import cell_estimates, consistent
+    seeds = replica_seeds(replications, seed)
+    results = {}
+    missing = []
+    for index, parameters in enumerate(points):
+        for replica_seed in seeds:
+            metrics = cache.get(parameters, replica_seed)
+            if metrics is None:
+                missing.append((index, replica_seed))
+            else:
+                results[index, replica_seed] = metrics
+    if missing:
+        computed = run_tasks([(replica_seed, points[index])
+                              for index, replica_seed in missing], processes)
+        for (index, replica_seed), metrics in zip(missing, computed):
+            cache.put(points[index], replica_seed, metrics)
+            results[index, replica_seed] = metrics
+    sweep = []
+    for index, parameters in enumerate(points):
+        point_results = [results[index, replica_seed] for replica_seed in seeds]
+        sweep.append({
+            "parameters": parameters,
+            "results": point_results,
+            "summary": summarize(point_results, confidence),
+        })
+        if analytic:
+            estimates = [float(estimate) for estimate
+                         in cell_estimates(Parameters(**parameters))]
+            sweep[-1]["analytic"] = estimates
+            sweep[-1]["consistent"] = consistent(sweep[-1]["summary"],
+                                                 estimates)
+    return sweep
+
+
+def _axis(argument):
+    """
+    parse NAME=VALUE,VALUE,... from the command line
+    """
+    name, values = argument.split("=", 1)
+    return name, [json.loads(value) for value in values.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="sweep the simulation over a grid of parameters")
+    parser.add_argument("axes", nargs="+", type=_axis,
+                        help="NAME=VALUE,VALUE,... for every swept parameter")
+    parser.add_argument("-n", "--replications", type=int, default=10)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-p", "--processes", type=int, default=None,
+                        help="defaults to the number of cores")
+    parser.add_argument("-c", "--confidence", type=float, default=0.95)
+    parser.add_argument("--cache", default=CACHE_DIR)
+    parser.add_argument("--analytic", action="store_true",
+                        help="add the analytic estimates of every metric")
+    args = parser.parse_args()
+
+    axes = dict(args.axes)
+    names = sorted(axes)
+    sweep = run_sweep(grid(**axes), args.replications, args.seed,
+                      args.processes, ResultCache(args.cache), args.confidence,
+                      args.analytic)
+    suffixes = ["", "_half_width"]
+    if args.analytic:
+        suffixes += ["_analytic", "_consistent"]
+    print ",".join(names + [metric + suffix for metric in PROD_METRICS
+                            for suffix in suffixes])
+    for point in sweep:
+        columns = [[mean for mean, _ in point["summary"]],
+                   [half_width for _, half_width in point["summary"]]]
+        if args.analytic:
+            columns += [point["analytic"], point["consistent"]]
+        print ",".join([str(point["parameters"][name]) for name in names] +
+                       [str(value) for values in zip(*columns)
+                        for value in values])
@@ -0,0 +1,154 @@
+#! /usr/bin/python
+
+"""
+this module keeps time series of every cell as the simulation runs:
+its channel occupancy, the length of its queue of pending calls, and
+its blocking and handoff failure rates, over fixed intervals
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+import csv
+import numpy
+from cellnet_statistics import TALK, FAILED, PENDING, BUSY, CHANNEL_EVENTS, \
+    STATES
+
+HANDOFF_STATE = STATES.index("handoff")
+
+# what's kept for every cell in every interval
+COLUMNS = [
+    "occupancy",  # mean share of busy channels
+    "queue_length",  # mean number of pending calls
+    "initiated",
+    "blocked",
+    "handoff",
+    "handoff_failed",
+]
+OCCUPANCY, QUEUE_LENGTH, INITIATED, BLOCKED, HANDOFF, HANDOFF_FAILED = \
+    range(COLUMNS.__len__())
+
+
+class CellTimeSeries:
+    def __init__(self, cells=7, channels=10, interval=10*60):
+        """
+        a recorder of the simulation, like the event log. only the
+        current interval is kept in python, every interval that is
+        over is a fixed size row
+        :param cells: number of cells in the network
+        :param channels: number of channels in every cell
+        :param interval: seconds in every interval
+        """
+        self.cells = cells
+        self.channels = channels
+        self.interval = interval
+        self.start = 0
+        self.rows = []
+        # the current state of every cell, and when it last changed
+        self.busy = [0] * cells
+        self.pending = [0] * cells
+        self.changed = [0] * cells
+        # the calls that wait for a channel
+        self.pending_calls = set()
+        self.current = [[0] * cells for _ in COLUMNS]
+
+    def record(self, time, entity, event):
+        while time >= self.start + self.interval:
+            self._close(self.start + self.interval)
+        if event in CHANNEL_EVENTS:
+            cell = entity.id // self.channels
+            self._integrate(cell, time)
+            if event == BUSY:
+                self.busy[cell] += 1
+            else:
+                self.busy[cell] -= 1
+            return
+        if event == TALK:
+            if entity.id in self.pending_calls:
+                # the call waited for the channel it got now
+                self.pending_calls.remove(entity.id)
+                self._integrate(entity.cell.id, time)
+                self.pending[entity.cell.id] -= 1
+            else:
+                self._attempt(entity)
+        elif event == PENDING:
+            self._attempt(entity)
+            self.pending_calls.add(entity.id)
+            self._integrate(entity.cell.id, time)
+            self.pending[entity.cell.id] += 1
+        elif event == FAILED:
+            self.pending_calls.discard(entity.id)
+            self._integrate(entity.cell.id, time)
+            self.pending[entity.cell.id] -= 1
+            if entity.state == HANDOFF_STATE:
+                self.current[HANDOFF_FAILED][entity.cell.id] += 1
+            else:
+                self.current[BLOCKED][entity.cell.id] += 1
+
+    def _attempt(self, call):
+        if call.state == HANDOFF_STATE:
+            self.current[HANDOFF][call.cell.id] += 1
+        else:
+            self.current[INITIATED][call.cell.id] += 1
+
+    def _integrate(self, cell, time):
+        elapsed = time - self.changed[cell]
+        self.current[OCCUPANCY][cell] += self.busy[cell] * elapsed
+        self.current[QUEUE_LENGTH][cell] += self.pending[cell] * elapsed
+        self.changed[cell] = time
+
+    def _close(self, end):
+        """
+        close the current interval at end, which may cut it short
+        """
+        for cell in range(self.cells):
+            self._integrate(cell, end)
+        length = float(end - self.start)
+        row = numpy.array(self.current, float)
+        if length > 0:
+            row[OCCUPANCY] /= length * self.channels
+            row[QUEUE_LENGTH] /= length
+        self.rows.append(row)
+        self.current = [[0] * self.cells for _ in COLUMNS]
+        self.start = end
+
+    def close(self, end_time):
+        """
+        called at the end of the run, to keep the last interval
+        """
+        if end_time > self.start:
+            self._close(end_time)
+
+    def series(self):
+        """
+        :return: the start of every interval, and every column of
+                 COLUMNS plus the blocking and handoff failure rates,
+                 shaped (intervals, cells). a rate is NaN where there
+                 were no attempts
+        """
+        rows = numpy.array(self.rows).reshape(-1, COLUMNS.__len__(),
+                                              self.cells)
+        series = dict((name, rows[:, i]) for i, name in enumerate(COLUMNS))
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            series["blocking"] = series["blocked"] / series["initiated"]
+            series["handoff_failure"] = \
+                series["handoff_failed"] / series["handoff"]
+        series["start"] = numpy.arange(rows.__len__()) * float(self.interval)
+        return series
+
+    def write(self, path):
+        """
+        write the series to path, as compressed NumPy arrays (.npz) or
+        as a CSV file with a row for every cell in every interval
+        """
+        series = self.series()
+        if path.endswith(".npz"):
+            numpy.savez_compressed(path, **series)
+            return
+        names = COLUMNS + ["blocking", "handoff_failure"]
+        with open(path, "wb") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["start", "cell"] + names)
+            for i, start in enumerate(series["start"]):
+                for cell in range(self.cells):
+                    writer.writerow([start, cell] + [series[name][i, cell]
+                                                     for name in names])
@@ -0,0 +1,87 @@
+#! /usr/bin/python
+
+"""
+this module builds the topology of the cellular network:
+how many cells it has, and where a call can be handed off to
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+
+class Topology:
+    def __init__(self, cells, neighbours=None):
+        """
+        :param cells: number of cells in the network
+        :param neighbours: for every cell, the ids of the cells its calls
+                           are handed off to. None lets a call be handed
+                           off to any cell, its own included
+        :type neighbours: list
+        """
+        self.cells = cells
+        self.neighbours = neighbours
+        if neighbours is not None:
+            if neighbours.__len__() != cells:
+                raise ValueError("expected neighbours for %d cells, got %d"
+                                 % (cells, neighbours.__len__()))
+            for cell, adjacent in enumerate(neighbours):
+                if adjacent.__len__() == 0:
+                    raise ValueError("cell %d has no neighbours" % cell)
+                for neighbour in adjacent:
+                    if not 0 <= neighbour < cells:
+                        raise ValueError("cell %d has an unknown neighbour %d"
+                                         % (cell, neighbour))
+
+
+def full(cells):
+    """
+    the original network: a call may be handed off to any cell
+    """
+    return Topology(cells)
+
+
+def hex_grid(rows, cols):
+    """
+    a grid of hexagonal cells, every odd row is shifted half a cell
+    to the right. cell ids are numbered row by row
+    """
+    neighbours = []
+    for row in range(rows):
+        shift = row % 2
+        for col in range(cols):
+            candidates = [(row, col - 1), (row, col + 1),
+                          (row - 1, col - 1 + shift), (row - 1, col + shift),
+                          (row + 1, col - 1 + shift), (row + 1, col + shift)]
+            neighbours.append([r * cols + c for r, c in candidates
+                               if 0 <= r < rows and 0 <= c < cols])
+    return Topology(rows * cols, neighbours)
+
+
+def load_adjacency(path):
+    """
+    read the topology from a file. every line holds the id of a cell
+    followed by the ids of its neighbours, "#" starts a comment.
+    the cells are numbered from 0
+    """
+    adjacency = {}
+    with open(path) as adjacency_file:
+        for line in adjacency_file:
+            ids = [int(id) for id in line.split("#", 1)[0].split()]
+            if ids:
+                adjacency.setdefault(ids[0], []).extend(ids[1:])
+    cells = max(adjacency) + 1 if adjacency else 0
+    return Topology(cells, [adjacency.get(cell, []) for cell in range(cells)])
+
+
+def build_topology(spec):
+    """
+    :param spec: "full:CELLS", "hex:ROWSxCOLS" or "file:PATH"
+    """
+    kind, _, argument = spec.partition(":")
+    if kind == "full":
+        return full(int(argument))
+    elif kind == "hex":
+        rows, cols = argument.lower().split("x")
+        return hex_grid(int(rows), int(cols))
+    elif kind == "file":
+        return load_adjacency(argument)
+    raise ValueError("unknown topology " + spec)
@@ -0,0 +1,114 @@
+#! /usr/bin/python
+
+"""
+this module draws the random variates of the simulation in blocks.
+every kind of variate has its own stream, seeded on its own, so two
+runs with the same seed see the same arrivals, talk times, handoffs
+and directions even when they differ elsewhere (common random numbers)
+author: Geiger&Geiger
+created: 18/10/26
+"""
+
+# the index of every stream, which goes into its seed
+ARRIVALS = 0
+TALKS = 1
+HANDOFFS = 2
+DIRECTIONS = 3
+
+BLOCK = 4096
+# the shortest talk, in seconds
+MIN_TALK = 5
+
+
+class VariateStream(object):
+    def __init__(self, seed, stream, block=BLOCK):
+        """
+        :param seed: the seed of the simulation, None for a random one
+        :param stream: the index of the stream
+        :param block: number of variates to draw at a time
+        """
+        self.stream = stream
+        self.block = block
+        self.reseed(seed)
+
+    def reseed(self, seed):
+        """
+        start the stream over from a new seed
+        """
+        # numpy is only loaded once it's needed, so importing
+        # the simulation stays cheap. every simulation needs it, the
+        # streams draw with numpy so seeded runs keep their variates
+        from numpy.random import RandomState
+        self.rng = RandomState(None if seed is None else [seed, self.stream])
+        self.values = []
+        self.position = 0
+
+    def next(self):
+        if self.position == self.values.__len__():
+            # python floats are faster to work with than numpy scalars
+            self.values = self.draw(self.block).tolist()
+            self.position = 0
+        value = self.values[self.position]
+        self.position += 1
+        return value
+
+    def draw(self, size):
+        raise NotImplementedError
+
+
+class ExponentialStream(VariateStream):
+    def __init__(self, seed, stream, scale, block=BLOCK):
+        VariateStream.__init__(self, seed, stream, block)
+        self.scale = scale
+
+    def draw(self, size):
+        return self.rng.exponential(self.scale, size)
+
+
+class TalkStream(VariateStream):
+    def __init__(self, seed, stream, mean, std, minimum, block=BLOCK):
+        """
+        normal variates, but never shorter than the minimum
+        """
+        VariateStream.__init__(self, seed, stream, block)
+        self.mean = mean
+        self.std = std
+        self.minimum = minimum
+
+    def draw(self, size):
+        return self.rng.normal(self.mean, self.std, size).clip(self.minimum)
+
+
+class BernoulliStream(VariateStream):
+    def __init__(self, seed, stream, p, block=BLOCK):
+        """
+        True with probability p
+        """
+        VariateStream.__init__(self, seed, stream, block)
+        self.p = p
+
+    def draw(self, size):
+        return self.rng.random_sample(size) <= self.p
+
+
+class Variates:
+    def __init__(self, params, seed=None):
+        """
+        :param params: the parameters of the simulation
+        :param seed: the seed of the simulation, None for a random one
+        :type params: config.Parameters
+        """
+        # with an arrival profile, the profile scales the arrivals
+        scale = float(params.ARRIVE_SCALE) / params.ARRIVE_MEAN
+        if params.ARRIVAL_PROFILE is not None:
+            scale = 1.0
+        self.interarrival = ExponentialStream(seed, ARRIVALS, scale)
+        self.talk = TalkStream(seed, TALKS, params.TALK_MEAN, params.TALK_VAR,
+                               MIN_TALK)
+        self.handoff = BernoulliStream(seed, HANDOFFS, params.HANDOFF_RATIO)
+        self.incoming = BernoulliStream(seed, DIRECTIONS, 0.5)
+
+    def reseed(self, seed):
+        for stream in [self.interarrival, self.talk, self.handoff,
+                       self.incoming]:
+            stream.reseed(seed)